@@ -2,7 +2,6 @@
 
 import gvars
 import cn_logging, logging
-import sge_tools as sge
 import argparse
 from sys import exit
 
@@ -23,8 +22,21 @@ SHORTCUTS = {
              'sim'      : 'simulate',
              'simu'     : 'simulate',
              'simulate' : 'simulate',
+             'r'        : 'regression',
+             'regr'     : 'regression',
+             'regress'  : 'regression',
+             'regression': 'regression',
              'latest'   : 'latest',
              'tree'     : 'tree',
+             'report'   : 'report',
+             'rpt'      : 'report',
+             'timing'   : 'report',
+             'summary'  : 'summary',
+             'summ'     : 'summary',
+             'server'   : 'server',
+             'stop_server': 'stop_server',
+             'w'        : 'watch',
+             'watch'    : 'watch',
              }
 
 ########################################################################################
@@ -44,7 +56,6 @@ def parse_args(version, doc):
     gvars.Log.addHandler(console)
 
     Log = gvars.Log
-    sge.Log = gvars.Log
 
     p = argparse.ArgumentParser(
         prog='gogo',
@@ -58,6 +69,9 @@ def parse_args(version, doc):
     p.add_argument('--tb',           action='store',             default='tb',    help="Specify a different tb.py configuration file.")
     p.add_argument('--dbg',          action='store_true',        default=False,   help="Used for debugging gogo.")
     p.add_argument('--noflush',      action='store_true',        default=False,   help="Permit turd files to stay.")
+    p.add_argument('--profile-startup', action='store_true',     default=False,   help="Print where the time went before any gadget ran (see startup.py).")
+    p.add_argument('--only-vkits',   action='store',             default=None,    help="Comma-separated names of the only vkits that genip checks and builds.")
+    p.add_argument('--no-server',    action='store_true',        default=False,   help="Run here, even if a gogo server is running (see gogo_server.py).")
 
     gvars.Options = p.parse_args()
 
@@ -0,0 +1,131 @@
+"""
+Tells the executors as soon as a job finishes, rather than leaving them to poll for it.
+
+Each gadget's script ends by writing its exit status to a 'done' marker file (see Gadget.prepare),
+and a gadget whose prior gadgets' markers all show success may launch (see Gadget.pauseJob)
+without waiting for SGE to report that they have completed.
+
+Anything waiting on a job calls wait(), which returns as soon as:
+  * a marker file is written in a watched directory (when inotify_simple is installed),
+  * a child process of gogo exits (SIGCHLD, while catch_children is in effect), or
+  * a gadget is marked as completed (notify).
+Otherwise, it returns after the timeout.
+"""
+
+import errno
+import fcntl
+import os
+import select
+import signal
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# The pipe that notify writes to, to wake up wait
+Pipe = None
+
+# The inotify instance, and the directories that it watches
+INotify = None
+Watched = set()
+
+########################################################################################
+def get_pipe():
+    "Returns the (read, write) file descriptors of the wakeup Pipe, creating it the first time."
+
+    global Pipe
+
+    if Pipe is None:
+        Pipe = os.pipe()
+        for fdesc in Pipe:
+            flags = fcntl.fcntl(fdesc, fcntl.F_GETFL)
+            fcntl.fcntl(fdesc, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    return Pipe
+
+########################################################################################
+def notify(*args):
+    "Wake up anything in wait(). May be used as a signal handler."
+
+    try:
+        os.write(get_pipe()[1], b'x')
+    except OSError as exc:
+        # when the pipe is full, a wakeup is already pending
+        if exc.errno != errno.EAGAIN:
+            raise
+
+########################################################################################
+def watch(filename):
+    "Wake up wait() when filename is written. Without inotify_simple, this does nothing."
+
+    global INotify
+
+    if inotify_simple is None:
+        return
+
+    dirname = os.path.dirname(os.path.abspath(filename))
+    if dirname in Watched:
+        return
+
+    try:
+        if INotify is None:
+            INotify = inotify_simple.INotify()
+        flags = inotify_simple.flags
+        INotify.add_watch(dirname, flags.CLOSE_WRITE | flags.MOVED_TO)
+        Watched.add(dirname)
+    except OSError:
+        pass
+
+########################################################################################
+def wait(timeout):
+    "Returns once something may have finished, or after timeout seconds."
+
+    fdescs = [get_pipe()[0]]
+    if INotify is not None:
+        fdescs.append(INotify.fileno())
+
+    try:
+        ready, _, _ = select.select(fdescs, [], [], timeout)
+    except (select.error, OSError) as exc:
+        # interrupted by a signal, such as SIGCHLD
+        if exc.args[0] != errno.EINTR:
+            raise
+        return
+
+    # drain whatever woke us
+    if fdescs[0] in ready:
+        try:
+            while os.read(fdescs[0], 4096):
+                pass
+        except OSError:
+            pass
+    if INotify is not None and INotify.fileno() in ready:
+        INotify.read(timeout=0)
+
+########################################################################################
+class catch_children(object):
+    """
+    While in effect (as a with-statement), the exit of any child process wakes up wait().
+    Must be entered from the main thread, because only it may set signal handlers.
+    """
+
+    def __enter__(self):
+        get_pipe()
+        self.previous = signal.signal(signal.SIGCHLD, notify)
+        # don't interrupt system calls made elsewhere (such as in sge_tools)
+        signal.siginterrupt(signal.SIGCHLD, False)
+        return self
+
+    def __exit__(self, *args):
+        signal.signal(signal.SIGCHLD, self.previous or signal.SIG_DFL)
+        return False
+
+########################################################################################
+def read_marker(filename):
+    "Returns the exit status written to a done marker file, or None if it has not been written."
+
+    try:
+        with open(filename) as mfile:
+            return int(mfile.read().strip())
+    except (IOError, ValueError):
+        return None
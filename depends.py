@@ -12,9 +12,10 @@ __email__   = 'brian.hunter@cavium.com'
 
 ########################################################################################
 # Imports
-from generators import *
 import cn_logging
 import argparse
+import os
+import re
 
 ########################################################################################
 # Globals
@@ -24,115 +25,287 @@ ACTIONS = (
     'graph',  # graphs the dependency tree
     'deps',   # print the dependencies of a particular vkit
     'query',  # writes out the file graph.gml
+    'bench',  # times order_dependencies on large synthetic graphs
     )
 FONT_SIZE = 18          # letter size in graphs
 CHAR_SPACING = 5*FONT_SIZE   # helps determines space between nodes in subgraphs
 
+# Comments and strings, which are blanked out before looking for package references
+NOISE_RE = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"', re.DOTALL)
+
+# A reference to a package, as in 'import cn_pkg::*;' or 'cn_pkg::cn_object_c'
+PKG_REF_RE = re.compile(r'\b(\w+_pkg)\s*::')
+
+# The source files that are scanned for package references
+SCAN_SUFFIXES = ('.sv', '.svh')
+
+# The packages referenced by each scanned file, keyed on filename. Each value is
+# [mtime, size, packages]. See scan_file.
+PkgRefs = None
+PkgRefsChanged = False
+
 ########################################################################################
 # Exceptions
 class DependencyException(Exception):
     pass
 
-class Swapped(Exception):
-    pass
-
 ########################################################################################
 def order_dependencies(deps):
     """
     The function order_dependencies is given a dictionary. Each key in the dictionary is an entry,
     and it is assigned a list of other entries that it depends upon.
 
-    It returns a dictionary of nodes with their level number.
+    It returns a dictionary of nodes with their level number. A node with no dependencies is
+    at level 0, and every other node is one level above the highest of its dependencies.
+    Dependencies that are not themselves entries are ignored.
+
+    Raises DependencyException, naming the entries in the cycle, if there is a circular dependency.
     """
 
     if type(deps) != dict:
         raise DependencyException("Argument must be a dictionary.")
 
-    result = {it : 0 for it in deps.keys()}
     Log.debug("Starting with \n{}".format(deps))
 
-    curr_level = 0
-    swapped = True
-    while swapped:
-        swapped = False
-        entries = [it for it in result.keys() if result[it] == curr_level]
-        Log.debug("In level {} there are {}".format(curr_level, entries))
-        if(len(entries) == 0):
-            Log.debug("Something is wrong at empty level {}\n{}".format(curr_level, result))
-            return None
-        for key_entry in entries:
-            Log.debug("Looking at {} at level {}".format(key_entry, result[key_entry]))
-            try:
-                for check_entry in entries:
-                    if key_entry == check_entry:
-                        continue
-                    if check_entry in deps[key_entry]:
-                        result[key_entry] = curr_level+1
-                        Log.debug("Elevating {} to level {} because it depends on {}".format(key_entry, result[key_entry], check_entry))
-                        Log.debug("deps[{}] are {}".format(key_entry, deps[key_entry]))
-                        # check for circular import
-                        if key_entry in deps[check_entry]:
-                            exc = "Found circular import between {} and {}".format(key_entry, check_entry)
-                            raise DependencyException(exc)
-                        raise Swapped
-            except Swapped:
-                swapped = True
-        curr_level += 1
+    # each entry's dependencies (only once each) and the entries that depend upon it
+    needs = {}
+    users = {it : [] for it in deps}
+    for node in deps:
+        needs[node] = set([it for it in deps[node] if it in deps and it != node])
+        for dep in needs[node]:
+            users[dep].append(node)
+
+    # Kahn's algorithm: an entry is leveled once all of its dependencies have been
+    remaining = {it : len(needs[it]) for it in deps}
+    result = {}
+    ready = [it for it in deps if remaining[it] == 0]
+    for node in ready:
+        result[node] = 0
+    while ready:
+        node = ready.pop()
+        for user in users[node]:
+            remaining[user] -= 1
+            if remaining[user] == 0:
+                result[user] = 1 + max([result[it] for it in needs[user]])
+                ready.append(user)
+
+    if len(result) != len(deps):
+        cycle = find_cycle(needs, [it for it in deps if it not in result])
+        raise DependencyException("Found circular dependency: {}".format(' -> '.join(cycle)))
 
     return result
 
 ########################################################################################
-def find_dependencies(working_dir):
+def find_cycle(needs, stuck):
+    """
+    Returns a list of the entries in a cycle, with the first entry repeated at the end.
+
+    needs : (dict) Each entry's set of dependencies
+    stuck : (list) Entries that could not be leveled. Each of these depends upon another.
+    """
+
+    stuck = set(stuck)
+    path = []
+    index = {}
+    node = sorted(stuck)[0]
+    while node not in index:
+        index[node] = len(path)
+        path.append(node)
+        node = sorted([it for it in needs[node] if it in stuck])[0]
+    return path[index[node]:] + [node]
+
+########################################################################################
+def find_dependencies(working_dir=None, vkits=None, cache_file=None, graph_file=None):
     """
-    Looks at all of the sub-directories of working_dir, considering each one a node.
-    Searches through each file looking for references to pkgs with a different name.
-    Returns a dictionary of nodes and lists of dependencies. Only dependencies that
-    are also nodes are considered. The rest are considered extraneous.
-
-    working_dir : (str) The name of a directory (usually vkits/)
-    =>          : (dict) Keys are subdirectories of working_dir. Each value is a list
-                         of strings representing packages that dir depends upon.
+    Searches through the source files of each vkit, looking for references to the packages
+    of other vkits. Returns a dictionary of vkits and lists of dependencies. Only packages
+    that belong to one of the vkits are considered. The rest are considered extraneous.
+
+    working_dir : (str) The name of a directory (usually vkits/), each sub-directory of which
+                        is a vkit with a package named <dir>_pkg. Ignored if vkits is given.
+    vkits       : (list of (str, str, str)) The name, directory, and package name of each vkit
+    cache_file  : (str) Where the package references of each file are kept between runs, so that
+                        only files that have changed are scanned again.
+    graph_file  : (str) Where the result is kept between runs, together with the mtimes of the
+                        directories and files it was found from. While none of those has changed,
+                        it is returned without walking the vkits again.
+    =>          : (dict) Keys are vkit names. Each value is a list of the names of the vkits
+                         whose packages it references.
     """
-    import os
-    import re
-    pat = re.compile("([\w_]+)_pkg")
-
-    Log.debug("Finding dependencies in {}".format(working_dir))
-
-    vkits = [it for it in os.listdir(working_dir) if os.path.isdir(it)]
-    results = {it : [] for it in vkits}
-
-    for vkit in vkits:
-        requirements = []
-        lines = lines_from_dir("*.sv", vkit)
-        matching_lines = grep("_pkg", lines)
-        for line in matching_lines:
-            # remove anything trailing a //
-            line = line.split('//')[0]
-            # remove anything between double-quotes
-            while line.count('"') >= 2:
-                sep_line = line.split('"')
-                line = sep_line[0] + sep_line[2]
-                Log.debug("Pulled {} and now line is {}".format(sep_line[1], line))
-            matches = pat.findall(line)
-            requirements.extend([it for it in matches if it != vkit and it in vkits])
-        # make unique
-        requirements = list(set(requirements))
-        results[vkit] = requirements
-        Log.debug("vkit {} requires {}".format(vkit, requirements))
+
+    from pymake import find_files
+
+    if vkits is None:
+        Log.debug("Finding dependencies in {}".format(working_dir))
+        dirs = [it for it in os.listdir(working_dir) if os.path.isdir(os.path.join(working_dir, it))]
+        vkits = [(it, os.path.join(working_dir, it), '{}_pkg'.format(it)) for it in dirs]
+
+    results = load_graph(graph_file, vkits)
+    if results is not None:
+        Log.debug("Vkit dependencies are unchanged since they were last found")
+        return results
+
+    pkg_owners = {pkg_name : name for (name, dir_name, pkg_name) in vkits}
+    load_pkg_refs(cache_file)
+
+    results = {}
+    visited = []
+    files = {}
+    for (name, dir_name, pkg_name) in vkits:
+        # the generated package directory, and any vkits within this one, are not part of it
+        dir_name = os.path.abspath(dir_name)
+        prune = [os.path.join(dir_name, pkg_name)]
+        prune.extend([it[1] for it in vkits if os.path.abspath(it[1]).startswith(dir_name + os.sep)])
+
+        requirements = set()
+        for (fname, stat) in find_files([dir_name], SCAN_SUFFIXES, prune=prune, visited=visited):
+            requirements.update(scan_file(fname, stat))
+            files[fname] = stat.st_mtime
+        results[name] = sorted(set([pkg_owners[it] for it in requirements if it in pkg_owners]) - set([name]))
+        Log.debug("vkit {} requires {}".format(name, results[name]))
+
+    save_pkg_refs(cache_file)
+    save_graph(graph_file, vkits, visited, files, results)
     return results
 
+########################################################################################
+def load_graph(graph_file, vkits):
+    """
+    Returns the results of find_dependencies saved in graph_file, if they were found for the same
+    vkits and no directory or file that was scanned has changed since. Otherwise, returns None.
+    Each directory costs one stat, and the files are stat'ed in parallel (see pymake.stat_mtimes).
+    """
+
+    import cPickle as pickle
+    from pymake import stat_mtimes
+
+    if not graph_file:
+        return None
+    try:
+        with open(graph_file, 'rb') as gfile:
+            saved = pickle.load(gfile)
+        if saved['vkits'] != vkits:
+            return None
+        # a file added, removed, or renamed changes the mtime of its directory
+        for dirname, mtime in saved['dirs'].items():
+            if os.stat(dirname).st_mtime != mtime:
+                return None
+    except Exception:
+        return None
+
+    if stat_mtimes(list(saved['files'])) != saved['files']:
+        return None
+    return saved['results']
+
+########################################################################################
+def save_graph(graph_file, vkits, dirs, files, results):
+    """
+    Write the results of find_dependencies to graph_file, along with the mtimes of the directories
+    that were walked and of the files that were scanned.
+    """
+
+    import cPickle as pickle
+    import time
+    from pymake import INDEX_MIN_AGE
+
+    if not graph_file:
+        return
+
+    dir_mtimes = {}
+    for dirname in dirs:
+        try:
+            dir_mtimes[dirname] = os.stat(dirname).st_mtime
+        except OSError:
+            return
+
+    # a file could still be added within the same mtime tick of a directory changed just now
+    if any(it > time.time() - INDEX_MIN_AGE for it in dir_mtimes.values()):
+        return
+
+    saved = {'vkits': vkits, 'dirs': dir_mtimes, 'files': files, 'results': results}
+    tmp_name = "{}.{}".format(graph_file, os.getpid())
+    try:
+        with open(tmp_name, 'wb') as gfile:
+            pickle.dump(saved, gfile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_name, graph_file)
+    except (IOError, OSError, pickle.PicklingError):
+        pass
+
+########################################################################################
+def scan_file(fname, stat):
+    """
+    Returns the names of the packages referenced by a file. The file is only read if its mtime
+    or size have changed since it was last scanned.
+    """
+
+    global PkgRefsChanged
+
+    try:
+        mtime, size, pkgs = PkgRefs[fname]
+        if mtime == stat.st_mtime and size == stat.st_size:
+            return pkgs
+    except (KeyError, ValueError):
+        pass
+
+    try:
+        with open(fname) as sfile:
+            text = sfile.read()
+    except IOError:
+        return []
+
+    # string literals and comments are blanked out, so as not to count the packages they mention
+    text = NOISE_RE.sub(' ', text)
+    pkgs = sorted(set(PKG_REF_RE.findall(text)))
+    PkgRefs[fname] = [stat.st_mtime, stat.st_size, pkgs]
+    PkgRefsChanged = True
+    return pkgs
+
+########################################################################################
+def load_pkg_refs(cache_file):
+    "Read PkgRefs from the cache_file the first time. A missing or bad file starts a full scan."
+
+    global PkgRefs
+    import cPickle as pickle
+
+    if PkgRefs is None:
+        PkgRefs = {}
+        if cache_file:
+            try:
+                with open(cache_file, 'rb') as cfile:
+                    refs = pickle.load(cfile)
+                if type(refs) == dict:
+                    PkgRefs = refs
+            except Exception:
+                pass
+
+########################################################################################
+def save_pkg_refs(cache_file):
+    "Write PkgRefs to the cache_file, if any have changed."
+
+    global PkgRefsChanged
+    import cPickle as pickle
+
+    if not PkgRefsChanged or not cache_file:
+        return
+
+    tmp_name = "{}.{}".format(cache_file, os.getpid())
+    try:
+        with open(tmp_name, 'wb') as cfile:
+            pickle.dump(PkgRefs, cfile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_name, cache_file)
+    except (IOError, OSError, pickle.PicklingError):
+        pass
+    PkgRefsChanged = False
+
 ########################################################################################
 def print_ordered_deps(ordered):
     "Input is a dictionary of ordered nodes with their level number. Print by level number."
 
-    level = 0
-    while True:
-        nodes = [it for it in ordered if ordered[it] == level]
-        if not nodes:
-            break
-        Log.info("{:3d} : {}".format(level, nodes))
-        level += 1
+    levels = {}
+    for node in ordered:
+        levels.setdefault(ordered[node], []).append(node)
+    for level in sorted(levels):
+        Log.info("{:3d} : {}".format(level, levels[level]))
 
 ########################################################################################
 def reduce_deps(deps, max_level, order=None):
@@ -258,6 +431,36 @@ def create_subgraph(graph, node):
 
     return subgraph, pos
 
+########################################################################################
+def benchmark(sizes=(1000, 5000, 20000), max_deps=8):
+    """
+    Times order_dependencies on synthetic graphs with the given numbers of nodes, each of which
+    depends on up to max_deps earlier nodes. Then times the detection of a long cycle.
+    """
+
+    import random
+    import time
+
+    rand = random.Random(1)
+    for size in sizes:
+        deps = {}
+        for idx in range(size):
+            deps['n%d' % idx] = ['n%d' % rand.randrange(idx) for _ in range(min(idx, rand.randint(0, max_deps)))]
+
+        start = time.time()
+        order = order_dependencies(deps)
+        Log.info("{:6d} nodes, {:3d} levels in {:.3f}s".format(size, max(order.values())+1, time.time() - start))
+
+        # close a cycle through every node from the last to the first
+        deps['n0'] = ['n%d' % (size-1)]
+        for idx in range(1, size):
+            deps['n%d' % idx].append('n%d' % (idx-1))
+        start = time.time()
+        try:
+            order_dependencies(deps)
+        except DependencyException as exc:
+            Log.info("{:6d} nodes, cycle of {} found in {:.3f}s".format(size, len(str(exc).split(' -> '))-1, time.time() - start))
+
 ########################################################################################
 def parse_args():
     "Parse command-line"
@@ -281,8 +484,11 @@ def parse_args():
 if __name__ == '__main__':
     options = parse_args()
 
+    if 'bench' in options.actions:
+        benchmark()
+
     # determine dependencies to use
-    if 'test' in options.actions:
+    if 'test' in options.actions or 'bench' in options.actions:
         deps = {
             'uvm'       : [],
             'cn'        : ['uvm'],
@@ -302,7 +508,6 @@ if __name__ == '__main__':
                            'dtx', 'reg', 'rsl', 'credits', 'gmem', 'swi', 'pcie'],
         }
     else:
-        import os
         working_dir = os.getcwd()
         deps = find_dependencies(working_dir)
 
@@ -0,0 +1,368 @@
+"""
+Runs gadgets' jobs on either SGE (through sge_tools) or on this machine.
+
+Each gadget picks its backend with Gadget.executor, which when left as None is 'local' if the
+gadget is named in PROJ.LOCAL_GADGETS and PROJ.EXECUTOR otherwise. The local backend runs each
+job's command in csh, no more at once than fit within PROJ.LOCAL_CORES (see Gadget.cores), and
+calls the same preLaunchCallback and completedCallback that SGE would. The SGE backend hands each
+job to sge_tools.managePool, which submits and kills it as it always has.
+
+Batch jobs of both backends are launched from one loop (see run_pools), which is woken as soon as
+a local job exits or a job's done marker is written (see completion.py), and which holds back
+each job (with pauseJob) until the gadgets it follows have finished, whichever side ran them.
+
+Interactive jobs are still run by sge_tools.waitForSomeJobs, with any local ones in a thread
+alongside.
+"""
+
+import completion
+import errno
+import gvars
+import multiprocessing
+import os
+import signal
+import sge_tools as sge
+import subprocess
+import sys
+import threading
+
+# The pools are woken as soon as a local job exits or a marker is written (see completion.py).
+# They look for the done markers at least this often, in seconds, since inotify does not see
+# files written by other hosts over NFS.
+MARKER_POLL = 0.5
+
+# The pools that are running, so that kill_all can find them
+Pools = []
+
+########################################################################################
+def get_executor(job):
+    "Returns the name of the backend that will run the job."
+
+    if job.executor is not None:
+        return job.executor
+    if job.name in gvars.PROJ.LOCAL_GADGETS:
+        return 'local'
+    return gvars.PROJ.EXECUTOR
+
+########################################################################################
+def get_core_budget():
+    "Returns the number of cores that local jobs may use at once."
+
+    if gvars.PROJ.LOCAL_CORES > 0:
+        return gvars.PROJ.LOCAL_CORES
+    return multiprocessing.cpu_count()
+
+########################################################################################
+def manage_pool(jobs):
+    "Run the batch jobs, as sge.managePool does, on whichever backend each one calls for."
+
+    local = [it for it in jobs if get_executor(it) == 'local']
+    remote = [it for it in jobs if get_executor(it) != 'local']
+
+    pools = []
+    if local:
+        pools.append(LocalPool(local, get_core_budget()))
+    if remote:
+        pools.append(SgePool(remote))
+
+    with completion.catch_children():
+        run_pools(pools)
+
+########################################################################################
+def wait_for_jobs(jobs):
+    "Run the interactive jobs, as sge.waitForSomeJobs does, on whichever backend each one calls for."
+
+    run_split(jobs, lambda remote: sge.waitForSomeJobs(remote, pollingMode=False))
+
+########################################################################################
+def run_split(jobs, run_remote):
+    """
+    Run the local jobs with a LocalPool and hand the rest to run_remote, concurrently (in a thread)
+    if there are both. Any exception (such as GadgetFailed) raised by either side is raised here.
+    """
+
+    local = [it for it in jobs if get_executor(it) == 'local']
+    remote = [it for it in jobs if get_executor(it) != 'local']
+
+    if not local:
+        run_remote(remote)
+        return
+
+    with completion.catch_children():
+        run_both(LocalPool(local, get_core_budget()), remote, run_remote)
+
+########################################################################################
+def run_both(pool, remote, run_remote):
+    "Run the local pool and, if there are any remote jobs, run_remote alongside it."
+
+    if not remote:
+        pool.run()
+        return
+
+    thread = threading.Thread(target=pool.run_in_thread, name='local_pool')
+    thread.daemon = True
+    thread.start()
+    try:
+        run_remote(remote)
+    except:
+        pool.kill()
+        raise
+    finally:
+        # poll, rather than join, so that Ctrl-C is still seen by the main thread
+        while thread.is_alive():
+            thread.join(MARKER_POLL)
+    if pool.exc_info:
+        reraise(pool.exc_info)
+
+########################################################################################
+def run_pools(pools):
+    """
+    Launch each pool's jobs once they are no longer paused, and return once all have completed
+    (or a pool has been killed). Any exception raised by a job's callbacks kills all the pools.
+    """
+
+    Pools.extend(pools)
+    try:
+        while all(not it.killed for it in pools) and any(it.todo or it.running for it in pools):
+            progress = False
+            for pool in pools:
+                progress = pool.reap() or progress
+            for pool in pools:
+                progress = pool.launch() or progress
+            if not progress:
+                completion.wait(MARKER_POLL)
+    except:
+        for pool in pools:
+            pool.kill()
+        raise
+    finally:
+        for pool in pools:
+            Pools.remove(pool)
+
+########################################################################################
+def reraise(exc_info):
+    "Raise the exception of exc_info (as from sys.exc_info) again, with its original traceback."
+
+    if sys.version_info[0] > 2:
+        raise exc_info[1].with_traceback(exc_info[2])
+    # the three-argument raise is not even valid syntax in python 3
+    exec("raise exc_info[0], exc_info[1], exc_info[2]")
+
+########################################################################################
+def kill_all():
+    "Kill the jobs of all pools."
+
+    for pool in list(Pools):
+        pool.kill()
+
+########################################################################################
+class Pool(object):
+    """
+    The jobs of one backend, which run_pools launches and completes. Descendant classes start
+    each job (noting it in self.running), reap those that have finished, and kill the rest.
+    """
+
+    #--------------------------------------------
+    def __init__(self, jobs):
+        self.todo = list(jobs)
+
+        # keyed on the backend's id for each job that is running
+        self.running = {}
+
+        # set if an exception is raised in run_in_thread
+        self.exc_info = None
+
+        # set by kill, after which no more jobs are launched
+        self.killed = False
+
+    #--------------------------------------------
+    def run(self):
+        "Run this pool's jobs on their own (see run_pools)."
+
+        run_pools([self])
+
+    #--------------------------------------------
+    def run_in_thread(self):
+        "As run, but saves any exception to be raised by the main thread."
+
+        try:
+            self.run()
+        except:
+            self.exc_info = sys.exc_info()
+
+    #--------------------------------------------
+    def launch(self):
+        "Launch all the jobs that are ready and that fit. Returns True if anything was done."
+
+        progress = False
+        for job in list(self.todo):
+            if job.pauseJob():
+                continue
+
+            if job.doNotLaunch:
+                self.todo.remove(job)
+                job.completedCallback()
+                progress = True
+                continue
+
+            if not self.fits(job):
+                continue
+
+            self.todo.remove(job)
+            self.launch_job(job)
+            progress = True
+        return progress
+
+    #--------------------------------------------
+    def launch_job(self, job):
+        "Hand the job off and start it."
+
+        job.preLaunchCallback()
+        self.start(job)
+
+    #--------------------------------------------
+    def fits(self, job):
+        "Returns True if there is room for the job to be started now."
+
+        return True
+
+########################################################################################
+class LocalPool(Pool):
+    """
+    Runs jobs as child processes of this one, with the total of their cores within a budget.
+    """
+
+    #--------------------------------------------
+    def __init__(self, jobs, budget):
+        super(LocalPool, self).__init__(jobs)
+        self.budget = budget
+
+    #--------------------------------------------
+    def fits(self, job):
+        cores = min(max(job.cores, 1), self.budget)
+        return cores <= self.budget - self.cores_in_use()
+
+    #--------------------------------------------
+    def start(self, job):
+        "Start the job's command, keyed in self.running on its pid with its Popen."
+
+        # stdoutPath may be a file (such as sys.stdout) rather than a path
+        stdout = job.stdoutPath
+        if stdout is not None and not hasattr(stdout, 'write'):
+            stdout = open(stdout, 'w')
+        stderr = subprocess.STDOUT if job.mergeStderr and stdout is not None else None
+
+        gvars.Log.debug("%s launching locally: %s" % (job.name, job.cmd))
+        try:
+            proc = subprocess.Popen(['csh', '-c', job.cmd], cwd=job.cwd, stdout=stdout, stderr=stderr)
+        finally:
+            if stdout is not job.stdoutPath:
+                stdout.close()
+        self.running[proc.pid] = (job, proc)
+
+    #--------------------------------------------
+    def reap(self):
+        "Complete each job whose process has finished. Returns True if any had."
+
+        progress = False
+        for pid, (job, proc) in list(self.running.items()):
+            try:
+                done_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+            except OSError as exc:
+                if exc.errno != errno.ECHILD:
+                    raise
+                # its exit status is lost, so it cannot be taken to have passed
+                done_pid, status, rusage = pid, None, None
+            if done_pid == 0:
+                continue
+
+            del self.running[pid]
+            if status is None:
+                proc.returncode = proc.returncode if proc.returncode is not None else -1
+            elif os.WIFSIGNALED(status):
+                proc.returncode = -os.WTERMSIG(status)
+            else:
+                proc.returncode = os.WEXITSTATUS(status)
+            job.job_status = proc.returncode
+            if rusage is not None:
+                job.local_rss = rusage.ru_maxrss
+            job.completedCallback()
+            progress = True
+        return progress
+
+    #--------------------------------------------
+    def cores_in_use(self):
+        return sum(min(max(job.cores, 1), self.budget) for job, _ in self.running.values())
+
+    #--------------------------------------------
+    def kill(self):
+        "Kill all running jobs and launch no more."
+
+        self.killed = True
+        for job, proc in list(self.running.values()):
+            try:
+                os.kill(proc.pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+########################################################################################
+class SgePool(Pool):
+    """
+    Hands each job to sge_tools.managePool, in a thread of its own, once the jobs it follows have
+    finished, so that sge_tools submits, completes and (with killAll) kills it as it always has.
+    Since Gadget.finished reads the done marker, which wakes run_pools, a job's dependents are
+    launched as soon as its script has ended, without waiting for sge_tools to see it complete.
+    """
+
+    #--------------------------------------------
+    def __init__(self, jobs):
+        super(SgePool, self).__init__(jobs)
+
+        # the sys.exc_info of each exception raised in a job's thread (such as GadgetFailed)
+        self.failures = []
+
+    #--------------------------------------------
+    def launch_job(self, job):
+        # sge_tools calls preLaunchCallback itself, as it submits the job
+        self.start(job)
+
+    #--------------------------------------------
+    def start(self, job):
+        "Start the job's thread, keyed in self.running on the job's name."
+
+        thread = threading.Thread(target=self.manage, args=(job,), name='sge_%s' % job.name)
+        thread.daemon = True
+        self.running[job.name] = (job, thread)
+        thread.start()
+
+    #--------------------------------------------
+    def manage(self, job):
+        "Run the one job with sge_tools, noting any exception for reap to raise."
+
+        try:
+            sge.managePool([job])
+        except:
+            self.failures.append(sys.exc_info())
+        finally:
+            completion.notify()
+
+    #--------------------------------------------
+    def reap(self):
+        "Forget each job whose thread has finished. Returns True if any had."
+
+        progress = False
+        for name, (job, thread) in list(self.running.items()):
+            if not thread.is_alive():
+                del self.running[name]
+                progress = True
+        if self.failures:
+            reraise(self.failures.pop(0))
+        return progress
+
+    #--------------------------------------------
+    def kill(self):
+        "Kill all submitted jobs and launch no more."
+
+        self.killed = True
+        if self.running:
+            sge.killAll()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python2.7
+
+"""
+Expands flists into the set of source files that VCS would read from them.
+
+An flist may contain source files, nested flists (-f, or -F whose contents are relative to the
+directory of the nested flist), +incdir+ directories, library files (-v), and library directories (-y)
+whose files have a +libext+ extension. Other options, such as +define+, are skipped (along with
+the argument of those in ARG_OPTIONS, such as -l log), as are // and /* */ comments. $VARIABLES
+are expanded from the environment. As with VCS, relative paths are relative to the directory that
+the tool runs in. A `project` directory in a path is taken to be gogo's link to the project root
+(see resolve_project), whether or not the link has been made yet.
+
+The expansion of each flist is cached in .gogo/flists.pkl, and is used again for as long as the
+contents of the flist and of every flist nested within it are unchanged. -y directories are
+listed afresh each time.
+
+The `include graph is cached in .gogo/includes.pkl: the names that each file includes, kept
+until the file's mtime or size changes. Only the files that are reached are scanned, so a header
+edit changes the sources (and so the genip keys and vlog fingerprint) of exactly those flists
+that reach it, through however many includes and +incdir+ directories of other vkits.
+"""
+
+from __future__ import print_function
+
+import cPickle as pickle
+import genip_cache
+import os
+import re
+
+# The expansion of each flist, keyed on (flist, cwd). Each is ([(flist, md5)...], expansion).
+# The 'format' entry is CACHE_FORMAT, which changes whenever the expansions would.
+Cache = None
+CACHE_FORMAT = 3
+CacheFilename = None
+CacheChanged = False
+
+# The names `included by each file, keyed on file. Each is (mtime, size, [names]).
+Includes = None
+IncludesFilename = None
+IncludesChanged = False
+
+# // only begins a comment at the start of a word, so that paths such as $ROOT//x.sv are kept whole
+COMMENT_RE = re.compile(r'(?:^|(?<=\s))//[^\n]*|/\*.*?\*/', re.DOTALL | re.MULTILINE)
+INCLUDE_RE = re.compile(r'^\s*`include\s+"([^"]+)"', re.MULTILINE)
+
+# The options of VCS and vlogan, other than -f, -F, -v and -y, whose argument is the next word,
+# which is skipped along with them rather than taken for a source
+ARG_OPTIONS = set([
+    '-assert', '-CC', '-CFLAGS', '-cm', '-cm_dir', '-cm_hier', '-cm_name', '-e', '-i',
+    '-l', '-LDFLAGS', '-liblist', '-libmap', '-load', '-Mdir', '-Mlib', '-ntb_define',
+    '-ntb_filext', '-ntb_incdir', '-ntb_opts', '-ntb_spath', '-o', '-P', '-parameters',
+    '-sv_lib', '-sv_liblist', '-sv_root', '-syslib', '-timescale', '-top', '-work', '-xlrm',
+])
+
+# the extensions of files in -y directories when there is no +libext+
+DEFAULT_LIBEXT = ['.v', '.sv']
+
+# The sources that have been found to be missing, so that each is only warned of once
+Missing = set()
+
+########################################################################################
+def load_cache():
+    "Returns the Cache, reading it from .gogo the first time."
+
+    global Cache, CacheFilename
+
+    if Cache is None:
+        if CacheFilename is None:
+            import gvars
+            CacheFilename = os.path.join(gvars.GogoDir, 'flists.pkl')
+        try:
+            with open(CacheFilename, 'rb') as cfile:
+                Cache = pickle.load(cfile)
+        except Exception:
+            Cache = {}
+        if Cache.get('format') != CACHE_FORMAT:
+            Cache = {'format': CACHE_FORMAT}
+    return Cache
+
+########################################################################################
+def save_cache():
+    "Write the Cache back to .gogo, if it has changed."
+
+    global CacheChanged
+
+    if not CacheChanged:
+        return
+
+    tmp_name = "%s.%d" % (CacheFilename, os.getpid())
+    try:
+        with open(tmp_name, 'wb') as cfile:
+            pickle.dump(Cache, cfile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_name, CacheFilename)
+    except (IOError, OSError):
+        pass
+    CacheChanged = False
+
+########################################################################################
+def new_expansion():
+    """
+    Returns an empty expansion, which is a dict of:
+    flists   : The flist and all of the flists nested within it
+    files    : The source files, in order
+    incdirs  : The +incdir+ directories
+    libfiles : The -v library files
+    libdirs  : The -y library directories
+    libext   : The +libext+ extensions
+    """
+
+    return {'flists': [], 'files': [], 'incdirs': [], 'libfiles': [], 'libdirs': [], 'libext': []}
+
+########################################################################################
+def tokenize(flist):
+    "Returns the whitespace-separated words of an flist, without its comments."
+
+    with open(flist) as ffile:
+        text = ffile.read()
+    return COMMENT_RE.sub(' ', text).split()
+
+########################################################################################
+def parse_flist(flist, base, expansion):
+    """
+    Add everything in flist, and in the flists nested within it, to the expansion.
+
+    flist     : (str) The absolute name of the flist
+    base      : (str) The directory that relative paths within it are relative to
+    expansion : (dict) See new_expansion
+    """
+
+    if flist in expansion['flists']:
+        return
+    expansion['flists'].append(flist)
+
+    def get_path(word, relative_to=base):
+        return resolve_project(os.path.normpath(os.path.join(relative_to, os.path.expandvars(word))))
+
+    try:
+        words = tokenize(flist)
+    except IOError as exc:
+        import gvars
+        gvars.Log.warning("Unable to read flist: %s" % exc)
+        return
+
+    idx = 0
+    while idx < len(words):
+        word = words[idx]
+        idx += 1
+        if word in ('-f', '-F', '-v', '-y'):
+            if idx == len(words):
+                break
+            arg = words[idx]
+            idx += 1
+            if word == '-f':
+                parse_flist(get_path(arg), base, expansion)
+            elif word == '-F':
+                nested = get_path(arg)
+                parse_flist(nested, os.path.dirname(nested), expansion)
+            elif word == '-v':
+                expansion['libfiles'].append(get_path(arg))
+            else:
+                expansion['libdirs'].append(get_path(arg))
+        elif word.startswith('+incdir+'):
+            expansion['incdirs'].extend([get_path(it) for it in word.split('+')[2:] if it])
+        elif word.startswith('+libext+'):
+            expansion['libext'].extend([it for it in word.split('+')[2:] if it])
+        elif word in ARG_OPTIONS:
+            idx += 1
+        elif word.startswith(('+', '-')):
+            continue
+        else:
+            expansion['files'].append(get_path(word))
+
+########################################################################################
+def resolve_project(path):
+    """
+    Returns path with any `project` link within it replaced by gvars.RootDir, which it points to.
+    gogo only makes these links (in the testbench and in each vkit directory) once it runs, so the
+    flists of a fresh workspace would otherwise name files that do not yet exist. A real directory
+    called project is left alone.
+    """
+
+    import gvars
+
+    root = gvars.RootDir
+    if not root or not path.startswith(root + os.sep):
+        return path
+
+    # only the part of the path below the root is looked at, in case the root is itself in one
+    parts = path[len(root) + 1:].split(os.sep)
+    for idx, part in enumerate(parts):
+        if part != 'project':
+            continue
+        link = os.path.join(root, *parts[:idx + 1])
+        if os.path.islink(link) or not os.path.exists(link):
+            return os.path.join(root, *parts[idx + 1:])
+    return path
+
+########################################################################################
+def warn_missing(fname):
+    "Warn that a source file does not exist, once per file."
+
+    if fname not in Missing:
+        import gvars
+        Missing.add(fname)
+        gvars.Log.warning("Source file does not exist: %s" % fname)
+
+########################################################################################
+def expand_flist(flist, cwd=None):
+    """
+    Returns the expansion of an flist (see new_expansion), from the Cache if none of its
+    flists have changed.
+
+    flist : (str) The flist
+    cwd   : (str) The directory that the tool runs in, or None for the current directory
+    """
+
+    global CacheChanged
+
+    flist = resolve_project(os.path.abspath(flist))
+    cwd = os.path.abspath(cwd or os.getcwd())
+    cache = load_cache()
+
+    def get_hashes(flists):
+        try:
+            return [(it, genip_cache.hash_file(it)) for it in flists]
+        except (IOError, OSError):
+            return None
+
+    try:
+        hashes, expansion = cache[(flist, cwd)]
+        if get_hashes([it[0] for it in hashes]) == hashes:
+            return expansion
+    except KeyError:
+        pass
+
+    expansion = new_expansion()
+    parse_flist(flist, cwd, expansion)
+
+    # (an flist that could not be read leaves this uncached, so it will be read again)
+    hashes = get_hashes(expansion['flists'])
+    if hashes is not None:
+        cache[(flist, cwd)] = (hashes, expansion)
+        CacheChanged = True
+    return expansion
+
+########################################################################################
+def load_includes():
+    "Returns the Includes, reading them from .gogo the first time."
+
+    global Includes, IncludesFilename
+
+    if Includes is None:
+        if IncludesFilename is None:
+            import gvars
+            IncludesFilename = os.path.join(gvars.GogoDir, 'includes.pkl')
+        try:
+            with open(IncludesFilename, 'rb') as ifile:
+                Includes = pickle.load(ifile)
+        except Exception:
+            Includes = {}
+    return Includes
+
+########################################################################################
+def save_includes():
+    "Write the Includes back to .gogo, if any have changed."
+
+    global IncludesChanged
+
+    if not IncludesChanged:
+        return
+
+    tmp_name = "%s.%d" % (IncludesFilename, os.getpid())
+    try:
+        with open(tmp_name, 'wb') as ifile:
+            pickle.dump(Includes, ifile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_name, IncludesFilename)
+    except (IOError, OSError):
+        pass
+    IncludesChanged = False
+
+########################################################################################
+def get_includes(fname, stat):
+    """
+    Returns the file names given to the `include directives of a file. A file is only read
+    again once its mtime or size has changed.
+    """
+
+    global IncludesChanged
+
+    includes = load_includes()
+    try:
+        mtime, size, names = includes[fname]
+        if mtime == stat.st_mtime and size == stat.st_size:
+            return names
+    except KeyError:
+        pass
+
+    try:
+        with open(fname) as afile:
+            names = INCLUDE_RE.findall(afile.read())
+    except IOError:
+        return []
+    includes[fname] = (stat.st_mtime, stat.st_size, names)
+    IncludesChanged = True
+    return names
+
+########################################################################################
+def resolve_include(name, including_file, incdirs, cwd):
+    "Returns the file that an `include of name refers to, or None if it cannot be found."
+
+    for dirname in [os.path.dirname(including_file)] + incdirs + [cwd]:
+        fname = os.path.normpath(os.path.join(dirname, name))
+        if os.path.isfile(fname):
+            return fname
+    return None
+
+########################################################################################
+def get_sources(flists, cwd=None):
+    """
+    Returns all of the files that VCS would read given these flists: the flists themselves, the
+    files and libraries that they list, the files in their -y directories, and every file that
+    any of those `include, and so on. Files that do not exist are left out, with a warning.
+
+    flists : (list of str) The flists
+    cwd    : (str) The directory that the tool runs in, or None for the current directory
+    =>     : (list of str) Absolute file names, sorted
+    """
+
+    from pymake import find_files
+
+    cwd = os.path.abspath(cwd or os.getcwd())
+    expansions = [expand_flist(it, cwd) for it in flists]
+    save_cache()
+    genip_cache.save_file_hashes()
+
+    sources = set()
+    to_scan = []
+    incdirs = []
+    for expansion in expansions:
+        sources.update(expansion['flists'])
+        to_scan.extend(expansion['files'] + expansion['libfiles'])
+        incdirs.extend([it for it in expansion['incdirs'] if it not in incdirs])
+        libext = expansion['libext'] or DEFAULT_LIBEXT
+        for libdir in expansion['libdirs']:
+            if os.path.isdir(libdir):
+                to_scan.extend([it[0] for it in find_files([libdir], libext, recursive=False)])
+            else:
+                warn_missing(libdir)
+
+    sources.update(follow_includes(to_scan, incdirs, cwd))
+    return sorted(sources)
+
+########################################################################################
+def follow_includes(files, incdirs, cwd):
+    """
+    Returns the files, together with all the files that they `include, and that those `include,
+    and so on. Files that do not exist are left out, with a warning.
+
+    files   : (list of str) Absolute file names
+    incdirs : (list of str) The +incdir+ directories searched for included files
+    cwd     : (str) The directory that the tool runs in
+    =>      : (set of str) Absolute file names
+    """
+
+    result = set()
+    to_scan = list(files)
+    while to_scan:
+        fname = to_scan.pop()
+        if fname in result:
+            continue
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            warn_missing(fname)
+            continue
+        result.add(fname)
+        for name in get_includes(fname, stat):
+            included = resolve_include(name, fname, incdirs, cwd)
+            if included is not None and included not in result:
+                to_scan.append(included)
+
+    save_includes()
+    return result
+
+########################################################################################
+if __name__ == '__main__':
+    import gvars
+    import sys
+
+    import logging
+    logging.basicConfig()
+    gvars.Log = logging.getLogger('flists')
+    gvars.GogoDir = os.path.abspath('.gogo')
+    if not os.path.exists(gvars.GogoDir):
+        os.mkdir(gvars.GogoDir)
+    for source in get_sources(sys.argv[1:]):
+        print(source)
@@ -4,7 +4,11 @@ Commands returned by create_cmds will be concatenated with semicolons and run as
 """
 
 from __future__ import print_function
+import completion
+import gvars
 import sge_tools as sge
+import telemetry
+import time
 import utils
 
 Log = None
@@ -24,17 +28,33 @@ class GadgetCommand(object):
         self.no_modules = no_modules
         self.check_after = check_after
 
-    def get_lines(self, modules=None):
+    def get_lines(self, modules=None, done_file=None, resolve_modules=False):
+        """
+        Returns the lines of csh that run this command. If done_file is given, a failure writes
+        its exit status there before exiting (see completion.py). If resolve_modules is set, the
+        command is run with the cached environment of the modules (see module_env.py) rather than
+        with runmod, unless they cannot be found.
+        """
+
         result = []
         if self.comment:
             result.append('echo ">>>> %s"\n' % self.comment)
+        runmods = ""
         if modules and not self.no_modules:
-            runmods = "runmod -m %s" % ' -m '.join(modules) + " "
-        else:
-            runmods = ""
+            prefix = None
+            if resolve_modules:
+                import module_env
+                prefix = module_env.get_env_prefix(modules)
+            if prefix is not None:
+                runmods = prefix
+            else:
+                runmods = "runmod -m %s" % ' -m '.join(modules) + " "
         result.append('%s%s' % (runmods, self.command))
         if self.check_after:
-            result.extend(["if($?) then", " exit(-1);", "endif"])
+            result.append("if($?) then")
+            if done_file:
+                result.append(" echo -1 > %s" % done_file)
+            result.extend([" exit(-1);", "endif"])
         return result
 
 ########################################################################################
@@ -58,6 +78,66 @@ class Gadget(sge.Job):
 
         self.name = self.__class__.__name__
 
+        # Gadgets that must complete before this one may launch. A phase name stands for every
+        # gadget scheduled in that phase or in any earlier phase. When left as None, the gadget
+        # follows all gadgets of the earlier phases (see schedule.PHASES).
+        self.predecessors = None
+
+        # Files that this gadget reads and writes. A gadget will not launch until any other
+        # gadget whose outputs include one of its inputs has completed.
+        self.inputs = []
+        self.outputs = []
+
+        # Filled in by the schedule with the gadgets that this one must wait upon
+        self.prior_gadgets = []
+
+        # Set once this gadget has run, or has been found to have nothing to run
+        self.completed = False
+
+        # None until get_ready has been called, then True if there is a job to launch
+        self.readied = None
+
+        # ensures that the "...waiting for..." message is only printed once per gadget
+        self.printed_waiting_for = False
+
+        # Set by preLaunchCallback to the time that the job was handed off, for the telemetry
+        self.submit_time = None
+
+        # The script that prepare writes the commands to, and the marker file that the script
+        # writes its exit status to when it finishes
+        self.script_name = None
+        self.done_file = None
+
+        # The backend that runs this gadget's job, 'sge' or 'local' (see executor.py). When left
+        # as None, PROJ.LOCAL_GADGETS and PROJ.EXECUTOR decide.
+        self.executor = None
+
+        # The number of cores the job uses, counted against PROJ.LOCAL_CORES when run locally
+        self.cores = 1
+
+        # True if this gadget does all of its work in Python (in check_dependencies and create_cmds)
+        # and touches nothing that other gadgets do, so that it may be readied in a thread
+        # alongside others (see schedule.ready_in_threads)
+        self.lightweight = False
+
+        # True if this gadget's job may be run in one SGE job with others of the same phase (see
+        # gadgets/batch.py). When left as None, PROJ.COALESCE_GADGETS decides.
+        self.coalesce = None
+
+        # Set by the local executor (see executor.py) or by gadgets/batch.py once the job has
+        # finished, and, for jobs run locally, the peak memory of the job's process
+        self.job_status = None
+        self.local_rss = None
+
+    #--------------------------------------------
+    def get_predecessors(self):
+        """
+        Returns the list of gadgets (or phase names) that this gadget must follow, or None to
+        follow the phase ordering.
+        """
+
+        return self.predecessors
+
     #--------------------------------------------
     def create_cmds(self):
         """
@@ -74,10 +154,50 @@ class Gadget(sge.Job):
         """
 
         status = self.getExitStatus()
+        self.mark_completed(status)
 
         if status:
             raise GadgetFailed(self.name)
 
+    #--------------------------------------------
+    def getExitStatus(self):
+        "Returns the exit status of the job, wherever it ran."
+
+        if self.job_status is not None:
+            return self.job_status
+        return super(Gadget, self).getExitStatus()
+
+    #--------------------------------------------
+    def preLaunchCallback(self):
+        "Note when the job was handed off, for the telemetry."
+
+        self.submit_time = time.time()
+        telemetry.record('submit', self)
+
+    #--------------------------------------------
+    def mark_completed(self, status=None):
+        """
+        Mark this gadget as completed, so that those which follow it may launch, and record
+        how its job went (or that it had nothing to launch).
+        """
+
+        self.completed = True
+        completion.notify()
+        if self.submit_time is None:
+            telemetry.record('done', self)
+            return
+
+        fields = {'status': status}
+        try:
+            with open(self.script_name + '.start') as sfile:
+                fields['start'] = float(sfile.read().strip())
+        except (IOError, TypeError, ValueError):
+            pass
+        # only known for jobs that LocalPool reaped, each from its own wait4
+        if self.local_rss is not None:
+            fields['rss'] = self.local_rss
+        telemetry.record('finish', self, **fields)
+
     #--------------------------------------------
     def prepare(self):
         """
@@ -87,16 +207,20 @@ class Gadget(sge.Job):
         did all the work for us.
         """
 
-        import os.path
+        import os
+        start = time.time()
         self.commands = self.create_cmds()
-        if self.commands is None or self.commands == []:
-            Log.debug("%s Leaving prepare because there are no commands to run." % self.name)
-            return
 
         # make it a list if it's just a string
         if type(self.commands) is GadgetCommand:
             self.commands = [self.commands]
 
+        telemetry.record('create_cmds', self, commands=len(self.commands or []),
+                         duration=time.time() - start)
+        if self.commands is None or self.commands == []:
+            Log.debug("%s Leaving prepare because there are no commands to run." % self.name)
+            return
+
         Log.info("Running %s" % self.name)
 
         if self.name == '' or self.name is None:
@@ -104,21 +228,97 @@ class Gadget(sge.Job):
         file_name = ".%s" % self.name
         if self.cwd is not None:
             file_name = os.path.join(self.cwd, file_name)
+        file_name = self.script_name = utils.get_filename(file_name)
+
+        self.done_file = file_name + '.done'
+        if os.path.exists(self.done_file):
+            os.remove(self.done_file)
+        completion.watch(self.done_file)
+        self.turds.extend([file_name + '.start', self.done_file])
+
+        start = time.time()
+
+        # the environment of the modules is set once, at the top of the script, rather than by
+        # runmod for each command. Commands with no_modules (such as csh builtins, which runmod
+        # cannot run) simply follow it, as they would follow a runmod.
+        modules = self.runmod_modules
+        setenv_lines = None
+        if gvars.PROJ.MODULE_ENV and modules:
+            import module_env
+            setenv_lines = module_env.get_setenv_lines(modules)
+            if setenv_lines is not None:
+                modules = None
 
         with utils.open(file_name, 'w') as f:
             print("#!/usr/bin/csh", file=f)
+            # lets the telemetry tell the time spent queued from the time spent running
+            print("date +%%s.%%N > %s.start" % file_name, file=f)
+            for line in setenv_lines or []:
+                print(line, file=f)
             for command in self.commands:
-                lines = command.get_lines(self.runmod_modules)
+                lines = command.get_lines(modules, self.done_file, gvars.PROJ.MODULE_ENV)
                 for line in lines:
                     print(line, file=f)
+            print("echo 0 > %s" % self.done_file, file=f)
             print(file=f)
+        telemetry.record('script', self, duration=time.time() - start)
 
-        file_name = utils.get_filename(file_name)
         self.cmd = "source %s" % (file_name)
 
         # Launch me!
         return self
 
+    #--------------------------------------------
+    def is_free(self):
+        "Returns True if all of the gadgets that this one follows have completed."
+
+        return all(it.completed for it in self.prior_gadgets)
+
+    #--------------------------------------------
+    def finished(self):
+        """
+        Returns True if this gadget has completed, or if its job's script has written a done
+        marker showing success, even if the executor has yet to notice.
+        """
+
+        if self.completed:
+            return True
+        if self.submit_time is None or self.done_file is None:
+            return False
+        return completion.read_marker(self.done_file) == 0
+
+    #--------------------------------------------
+    def get_ready(self):
+        """
+        Checks dependencies and prepares the commands, only once and only after all prior gadgets
+        have completed. Returns True if there is a job to launch.
+        """
+
+        if self.readied is None:
+            start = time.time()
+            must_run = self.check_dependencies() == True
+            telemetry.record('check_dependencies', self, result=must_run, duration=time.time() - start)
+            if must_run:
+                self.prepare()
+            self.readied = bool(self.cmd) and not self.doNotLaunch
+            if not self.readied:
+                self.doNotLaunch = True
+        return self.readied
+
+    #--------------------------------------------
+    def pauseJob(self):
+        "Return true if any prior gadgets are not yet done. Otherwise, get ready to launch."
+
+        waiting_for = [it for it in self.prior_gadgets if not it.finished()]
+        if waiting_for:
+            if not self.printed_waiting_for:
+                Log.info("%s waiting for %s" % (self.name, [it.name for it in waiting_for]))
+                self.printed_waiting_for = True
+            return True
+
+        self.get_ready()
+        return False
+
     #--------------------------------------------
     def check_dependencies(self):
         """
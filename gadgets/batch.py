@@ -0,0 +1,81 @@
+"""
+Runs the jobs of several small gadgets as one SGE job, to save the scheduler round trip of each.
+"""
+
+import completion
+import gadget
+import gvars
+
+Log = gvars.Log
+
+class BatchGadget(gadget.Gadget):
+    """
+    Runs each member gadget's script in turn, in one job. The members must already be ready to
+    launch (see Gadget.get_ready), and none may follow another. Each member's script writes its
+    own done marker, so those that follow a member may launch as soon as it finishes (see
+    Gadget.pauseJob), and its completedCallback sees its own exit status.
+
+    SGE array jobs are not available through sge_tools, so this is one wrapper script instead.
+    """
+
+    #--------------------------------------------
+    def __init__(self, members, index=0):
+        super(BatchGadget, self).__init__()
+
+        self.members = members
+        first = members[0]
+        self.name = 'batch_%s_%d' % (first.schedule_phase, index)
+        self.schedule_phase = first.schedule_phase
+        self.queue = first.queue
+        self.resources = list(first.resources)
+        self.cwd = first.cwd
+        self.interactive = False
+        self.executor = 'sge'
+        self.coalesce = False
+        self.cores = max(it.cores for it in members)
+
+    #--------------------------------------------
+    def create_cmds(self):
+        """
+        Run each member's script in a shell of its own, so that one failing does not stop the rest.
+        The shell reads .cshrc, as it would were the member run on its own.
+        """
+
+        result = []
+        for member in self.members:
+            cmd = "csh %s" % member.script_name
+            if isinstance(member.stdoutPath, str):
+                cmd += " >& %s" % member.stdoutPath
+            result.append(gadget.GadgetCommand(cmd, comment=member.name, no_modules=True, check_after=False))
+        return result
+
+    #--------------------------------------------
+    def preLaunchCallback(self):
+        super(BatchGadget, self).preLaunchCallback()
+        for member in self.members:
+            member.preLaunchCallback()
+
+    #--------------------------------------------
+    def completedCallback(self):
+        """
+        Complete each member with the exit status its script wrote to its done marker, or with the
+        batch's own (or -1) if it never got that far. Raises the first member's GadgetFailed, once
+        all have been completed.
+        """
+
+        status = self.getExitStatus()
+        self.mark_completed(status)
+
+        failures = []
+        for member in self.members:
+            member_status = completion.read_marker(member.done_file)
+            if member_status is None:
+                member_status = status or -1
+            member.job_status = member_status
+            try:
+                member.completedCallback()
+            except gadget.GadgetFailed as exc:
+                failures.append(exc)
+
+        if failures:
+            raise failures[0]
@@ -29,7 +29,11 @@ class CleanGadget(gadget.Gadget):
         gvars.Log.info("Cleaning...")
         for dname in clean_dirs:
             try:
-                rmtree(dname)
+                if os.path.islink(dname):
+                    # such as a vkit library linked from the PROJ.GENIP_STORE
+                    os.remove(dname)
+                else:
+                    rmtree(dname)
                 Log.info("Removed dir %s" % dname)
             except:
                 pass
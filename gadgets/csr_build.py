@@ -46,6 +46,7 @@ class CsrBuildGadget(gadget.Gadget):
     #--------------------------------------------
     def completedCallback(self):
         exit_status = self.getExitStatus()
+        self.mark_completed(exit_status)
         if exit_status == 0:
             f = open(self.done_file, "w")
             f.close()
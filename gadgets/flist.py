@@ -6,9 +6,11 @@ from __future__ import print_function
 
 import gadget
 import gvars
-import glob
+import pymake
 import utils
 
+Log = gvars.Log
+
 class FlistGadget(gadget.Gadget):
     """Creates the .flist file for a testbench"""
     def __init__(self):
@@ -16,43 +18,59 @@ class FlistGadget(gadget.Gadget):
 
         self.schedule_phase = 'pre_vlog'
 
+        # the flist only depends upon the testbench sources, so it need not wait for genip
+        self.predecessors = ['post_build']
+        self.outputs = [utils.get_filename('.flist')]
+
     #--------------------------------------------
     def create_cmds(self):
-        "Create the flist file for this testbench."
+        """
+        Create the flist file for this testbench. It is only written when its contents change, so
+        that an unchanged testbench leaves it (and VCS's -Mupdate) undisturbed.
+        """
+
+        if utils.write_if_changed('.flist', self.get_contents()):
+            Log.info("Updated %s" % self.outputs[0])
+        else:
+            Log.debug("%s is up to date" % self.outputs[0])
+
+        return None
+
+    #--------------------------------------------
+    def get_contents(self):
+        "Returns the text of the flist file."
 
         import os
         tb_name = os.path.split(os.getcwd())[1]
         tb_dir = 'project/verif/%(tb_name)s' % locals()
-        root_dir = gvars.RootDir
 
         def get_sv_path(tb_name, fname):
             return "project/verif/%(tb_name)s/%(fname)s" % locals()
 
-        with utils.open('.flist', 'w') as ffile:
-            # print +incdirs
-            print("+incdir+%(tb_dir)s" % locals(), file=ffile)
-            for incdir in gvars.TB.INCDIRS:
-                print("+incdir+%(incdir)s" % locals(), file=ffile)
+        # print +incdirs
+        lines = ["+incdir+%(tb_dir)s" % locals()]
+        for incdir in gvars.TB.INCDIRS:
+            lines.append("+incdir+%(incdir)s" % locals())
 
-            # TB_TOP file must go first, because it is the one that imports uvm_pkg
-            print(get_sv_path(tb_name, tb_name + '_tb_top.sv'), file=ffile)
+        # TB_TOP file must go first, because it is the one that imports uvm_pkg
+        lines.append(get_sv_path(tb_name, tb_name + '_tb_top.sv'))
 
-            # print testbench sv files
-            all_files = glob.glob('*.sv')
+        # print testbench sv files, listed from the directory index. They are sorted, so that
+        # the flist does not change along with the order of the directory listing.
+        all_files = [os.path.relpath(it) for it in pymake.glob_files(['.'], ['*.sv'])]
 
-            # TODO: I don't know why this should not be there, but it results
-            # in tests being declared twice in the factory.
-            # if not gvars.VLOG.COMPTYPE == 'genip':
-            all_files.extend(glob.glob('tests/*.sv'))
+        # TODO: I don't know why this should not be there, but it results
+        # in tests being declared twice in the factory.
+        # if not gvars.VLOG.COMPTYPE == 'genip':
+        if os.path.isdir('tests'):
+            all_files.extend([os.path.relpath(it) for it in pymake.glob_files(['tests'], ['*.sv'])])
 
-            all_files = [it for it in all_files if not it.endswith('_tb_top.sv')]
-            for svfile in all_files:
-                print(get_sv_path(tb_name, svfile), file=ffile)
+        all_files = [it for it in sorted(all_files) if not it.endswith('_tb_top.sv')]
+        for svfile in all_files:
+            lines.append(get_sv_path(tb_name, svfile))
 
-            # print -y libraries
-            for libdir in gvars.TB.LIBRARIES:
-                print("-y %(libdir)s" % locals(), file=ffile)
+        # print -y libraries
+        for libdir in gvars.TB.LIBRARIES:
+            lines.append("-y %(libdir)s" % locals())
 
-        self.turds.append('.flist')
-        
-        return None
+        return '\n'.join(lines) + '\n'
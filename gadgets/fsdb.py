@@ -16,12 +16,14 @@ class FsdbGadget(gadget.Gadget):
         super(FsdbGadget, self).__init__()
 
         self.schedule_phase = 'pre_simulate'
+        self.lightweight    = True
         self.sim_dir        = sim_dir
         self.name           = 'fsdb'
         self.runLocally     = True
         self.fsdb_name      = os.path.join(self.sim_dir, 'fsdb.sh')
         self.tb_top         = gvars.TB.TOP
         self.vcomp_dir      = gvars.VLOG.VCOMP_DIR
+        self.predecessors   = ['post_clean']
 
     #--------------------------------------------
     def create_cmds(self):
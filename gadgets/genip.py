@@ -3,6 +3,7 @@
 import gadget
 import schedule
 import gvars
+import utils
 
 Log = gvars.Log
 
@@ -14,7 +15,14 @@ class GenipGadget(gadget.Gadget):
         self.name = 'genip'
         self.schedule_phase = 'genip'
 
-        for vkit in gvars.Vkits:
+        # only those named by --only-vkits (such as by gogo watch), if given
+        vkits = gvars.Vkits
+        if gvars.Options.only_vkits is not None:
+            names = gvars.Options.only_vkits.split(',')
+            vkits = [it for it in vkits if it.name in names]
+
+        # those at the head of the longest chains are launched first
+        for vkit in utils.prioritize_vkits(vkits):
             schedule.add_gadget(vkit)
             
     #--------------------------------------------
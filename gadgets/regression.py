@@ -0,0 +1,145 @@
+"""
+Runs every test of SIM.TESTLIST with SIM.SEEDS seeds each, sharing one build.
+"""
+
+from __future__ import print_function
+
+import gadget
+import glob
+import gvars
+import os
+import schedule
+import simlogs
+from gadgets.simulate import SimulateGadget
+
+Log = gvars.Log
+
+class RegressionGadget(gadget.Gadget):
+    """
+    Adds a simulation for each test and seed, each in its own sim/<test>.<seed> directory, then
+    summarizes them once all have run.
+    """
+
+    #--------------------------------------------
+    def __init__(self):
+        super(RegressionGadget, self).__init__()
+
+        self.schedule_phase = 'post_simulate'
+        self.name = 'regression'
+
+        # the number of simulations running now, kept within SIM.MAX_SIMS
+        self.running = 0
+
+        if gvars.SIM.WAVE or gvars.SIM.GUI:
+            Log.warning("Waves and GUIs are not used in regressions. Use each run's rerun script instead.")
+            gvars.SIM.WAVE = None
+            gvars.SIM.GUI = ''
+
+        tests = get_tests(gvars.SIM.TESTLIST)
+        if not tests:
+            Log.critical("No tests were found in SIM.TESTLIST '%s'" % gvars.SIM.TESTLIST)
+
+        self.sims = []
+        for test in tests:
+            for seed in get_seeds(gvars.SIM.SEED, gvars.SIM.SEEDS):
+                sim = RegressionSimGadget(self, test, seed)
+                schedule.add_gadget(sim)
+                self.sims.append(sim)
+
+        Log.info("Running %d simulations of %d tests." % (len(self.sims), len(tests)))
+
+    #--------------------------------------------
+    def prepare(self):
+        "Summarize the regression. Fail if any simulation did."
+
+        results = simlogs.scan([os.path.join(it.sim_dir, 'logfile') for it in self.sims])
+        for signature, logfiles in simlogs.get_buckets(results):
+            Log.error("%d failed with %s, such as %s" % (len(logfiles), signature, sorted(logfiles)[0]))
+
+        failed = [it for it in self.sims if it.status]
+        for sim in failed:
+            Log.error("%s failed. See %s" % (sim.name, os.path.join(sim.sim_dir, 'logfile')))
+        Log.info("Regression: %d passed, %d failed." % (len(self.sims) - len(failed), len(failed)))
+        if failed:
+            raise gadget.GadgetFailed(self.name)
+
+########################################################################################
+class RegressionSimGadget(SimulateGadget):
+    """
+    One simulation of a regression. It always runs in batch, no more at once than SIM.MAX_SIMS,
+    and its failure does not stop the others.
+    """
+
+    #--------------------------------------------
+    def __init__(self, regression, test, seed):
+        self.regression = regression
+        super(RegressionSimGadget, self).__init__(test, seed, '%s.%d' % (test, seed))
+        self.interactive = False
+
+        # the exit status, once it has run
+        self.status = None
+
+    #--------------------------------------------
+    def add_gadgets(self):
+        from gadgets.rerun import RerunGadget
+        rerun = RerunGadget(self.sim_dir, self.test, self.seed)
+        rerun.name = 'rerun.%s' % self.name
+        schedule.add_gadget(rerun)
+
+    #--------------------------------------------
+    def pauseJob(self):
+        if super(RegressionSimGadget, self).pauseJob():
+            return True
+        return not self.doNotLaunch and 0 < gvars.SIM.MAX_SIMS <= self.regression.running
+
+    #--------------------------------------------
+    def preLaunchCallback(self):
+        super(RegressionSimGadget, self).preLaunchCallback()
+        self.regression.running += 1
+
+    #--------------------------------------------
+    def completedCallback(self):
+        self.status = self.getExitStatus()
+        self.mark_completed(self.status)
+        if not self.doNotLaunch:
+            self.regression.running -= 1
+        if self.status:
+            Log.error("%s failed with exit status %s" % (self.name, self.status))
+
+########################################################################################
+def get_tests(testlist):
+    """
+    Returns the names of the tests in testlist, which is either a glob over test files (such as
+    'tests/*.sv'), or a file naming one test per line (where # starts a comment).
+    """
+
+    if any(it in testlist for it in '*?[') or testlist.endswith('.sv'):
+        files = sorted(glob.glob(testlist))
+        return [os.path.splitext(os.path.basename(it))[0] for it in files]
+
+    try:
+        with open(testlist) as tfile:
+            lines = [it.split('#', 1)[0].strip() for it in tfile]
+    except IOError as exc:
+        Log.critical("Unable to read SIM.TESTLIST %s: %s" % (testlist, exc))
+    return [it for it in lines if it]
+
+########################################################################################
+def get_seeds(first, count):
+    """
+    Returns count distinct seeds: those following first, or random ones if first is 0.
+    """
+
+    if first != 0:
+        return [first + it for it in range(count)]
+
+    # draw again on a repeat, so that no run is wasted; 0 is left out, since it means random
+    import random
+    seeds = []
+    drawn = set()
+    while len(seeds) < count:
+        seed = random.getrandbits(32)
+        if seed and seed not in drawn:
+            drawn.add(seed)
+            seeds.append(seed)
+    return seeds
@@ -0,0 +1,118 @@
+"""Summarizes the time each gadget took over the latest runs (see PROJ.REPORT_RUNS), and the critical path of the last."""
+
+from __future__ import print_function
+
+import gadget
+import gvars
+import os
+import telemetry
+
+Log = gvars.Log
+
+class ReportGadget(gadget.Gadget):
+    def __init__(self):
+        super(ReportGadget, self).__init__()
+
+        self.schedule_phase = 'pre_clean'
+
+    #--------------------------------------------
+    def prepare(self):
+        runs = telemetry.read_runs(os.path.join(gvars.GogoDir, 'telemetry.jsonl'))
+
+        # every run that got as far as its gadgets, even if all were up to date, but not this one
+        runs = [it for it in runs if it[0] != telemetry.RunId and any(ev.get('gadget') for ev in it[1])]
+        runs = runs[-gvars.PROJ.REPORT_RUNS:]
+        if not runs:
+            Log.info("No runs have been recorded in %s yet." % gvars.GogoDir)
+            return
+
+        for run_id, events in runs:
+            print_run(run_id, events)
+
+        print_critical_path(*runs[-1])
+
+########################################################################################
+def summarize(events):
+    """
+    Returns the timings of each gadget of a run as a dict keyed on gadget name, with the times
+    of each stage and the events' fields.
+    """
+
+    gadgets = {}
+    for event in events:
+        name = event.get('gadget')
+        if name is None:
+            continue
+        info = gadgets.setdefault(name, {'check': 0.0, 'prepare': 0.0, 'prior': [], 'status': '-'})
+        kind = event['event']
+        if kind == 'schedule':
+            info['prior'] = event.get('prior', [])
+        elif kind == 'check_dependencies':
+            info['check'] += event.get('duration', 0.0)
+            info['ready'] = event['time']
+        elif kind in ('create_cmds', 'script'):
+            info['prepare'] += event.get('duration', 0.0)
+        elif kind == 'done':
+            info['end'] = event['time']
+            info['status'] = 'skipped'
+        elif kind == 'submit':
+            info['submit'] = event['time']
+        elif kind == 'finish':
+            info['end'] = event['time']
+            info['start'] = event.get('start')
+            info['rss'] = event.get('rss')
+            info['status'] = 'failed' if event.get('status') else 'passed'
+    return gadgets
+
+########################################################################################
+def print_run(run_id, events):
+    "Print the timings of each gadget in a run."
+
+    gadgets = summarize(events)
+    run_start = events[0]['time']
+    status = [it.get('status') for it in events if it['event'] == 'run_end']
+
+    print('')
+    print("Run %s (%s) %s" % (run_id, ' '.join(events[0].get('gadgets', [])),
+                              status[0] if status else 'incomplete'))
+    print("   %-24s %8s %8s %8s %8s %8s %8s  %s" % ('gadget', 'begin', 'check', 'prepare', 'queued', 'exec', 'peak MB', 'status'))
+
+    def elapsed(begin, end):
+        if begin is None or end is None:
+            return '-'
+        return "%.1f" % (end - begin)
+
+    for name, info in sorted(gadgets.items(), key=lambda it: it[1].get('ready', 0)):
+        start = info.get('start') or info.get('submit')
+        # the peak memory of the job itself, only known for those run locally (in KB)
+        rss = "%.0f" % (info['rss'] / 1024.0) if info.get('rss') else '-'
+        print("   %-24s %8s %8.1f %8.1f %8s %8s %8s  %s" % (
+            name, elapsed(run_start, info.get('ready')), info['check'], info['prepare'],
+            elapsed(info.get('submit'), info.get('start')), elapsed(start, info.get('end')),
+            rss, info['status']))
+
+########################################################################################
+def print_critical_path(run_id, events):
+    """
+    Print the chain of gadgets that determined how long a run took: starting from the gadget that
+    ended last, follow the prior gadget that ended last back to the beginning.
+    """
+
+    gadgets = summarize(events)
+    ended = dict((name, info) for name, info in gadgets.items() if 'end' in info)
+    if not ended:
+        return
+
+    path = []
+    name = max(ended, key=lambda it: ended[it]['end'])
+    while name is not None:
+        path.append(name)
+        priors = [it for it in ended[name]['prior'] if it in ended]
+        name = max(priors, key=lambda it: ended[it]['end']) if priors else None
+    path.reverse()
+
+    run_start = events[0]['time']
+    print('')
+    print("Critical path of run %s:" % run_id)
+    for name in path:
+        print("   %-24s ended at %8.1f" % (name, ended[name]['end'] - run_start))
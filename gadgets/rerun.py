@@ -10,10 +10,16 @@ Log = gvars.Log
 
 class RerunGadget(gadget.Gadget):
     """Creates rerun/qrun scripts after sim completes"""
-    def __init__(self, sim_dir):
+    def __init__(self, sim_dir, test=None, seed=None):
         super(RerunGadget, self).__init__()
         self.sim_dir = sim_dir
+        self.test = test if test is not None else gvars.SIM.TEST
+        self.seed = seed if seed is not None else gvars.SIM.SEED
         self.schedule_phase = 'pre_simulate'
+        self.lightweight = True
+
+        # the scripts are only written out, so these may be created while compiling
+        self.predecessors = ['post_clean']
 
     #--------------------------------------------
     def make_script(self, name, cmd_line):
@@ -29,8 +35,13 @@ class RerunGadget(gadget.Gadget):
         r_name = os.path.join(self.sim_dir, 'rerun')
         q_name = os.path.join(self.sim_dir, 'qrun')
 
-        cmd_line = "gogo sim" #% (gvars.SIM.TEST, gvars.SIM.SEED)
-        cmd_args = list(set(['TEST=%s' % gvars.SIM.TEST, 'SEED=%d' % gvars.SIM.SEED] + gvars.CommandLineVariables))
+        cmd_line = "gogo sim"
+        cmd_args = ['TEST=%s' % self.test, 'SEED=%d' % self.seed]
+        for var in gvars.CommandLineVariables:
+            # this run's own test and seed replace those (and any regression's) on the command-line
+            name = var.split('=', 1)[0].rstrip('+').replace('SIM.', '')
+            if name not in ('TEST', 'SEED', 'DIR', 'TESTLIST', 'SEEDS', 'MAX_SIMS') and var not in cmd_args:
+                cmd_args.append(var)
         cmd_line += " %s" % ' '.join(cmd_args)
 
         # create qrun script
@@ -0,0 +1,39 @@
+"Starts or stops the gogo server for this testbench directory (see gogo_server.py)."
+
+import gadget
+import gvars
+import os
+import subprocess
+import sys
+
+Log = gvars.Log
+
+class ServerGadget(gadget.Gadget):
+    def __init__(self, stop=False):
+        super(ServerGadget, self).__init__()
+
+        self.schedule_phase = 'pre_clean'
+        self.stop = stop
+
+    #--------------------------------------------
+    def prepare(self):
+        import gogo_server
+        import module_env
+
+        # the server is for the environment that gogo started with, before any module was loaded
+        environ = module_env.Pristine
+
+        if self.stop:
+            if gogo_server.stop(gvars.Options.tb, environ):
+                Log.info("Stopped the gogo server for %s" % os.getcwd())
+            else:
+                Log.info("No gogo server is running for %s" % os.getcwd())
+            return
+
+        # the server must not be a child of this gogo, which may be one of its own
+        server_py = os.path.join(os.path.dirname(os.path.abspath(gogo_server.__file__)), 'gogo_server.py')
+        status = subprocess.call([sys.executable, server_py, 'start', '--tb', gvars.Options.tb], env=environ)
+        if status:
+            Log.error("The gogo server did not start. See %s" % os.path.join(gvars.GogoDir, 'server.log'))
+        else:
+            Log.info("A gogo server is running for %s, until idle for %d seconds" % (os.getcwd(), gvars.PROJ.SERVER_IDLE))
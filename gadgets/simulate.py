@@ -19,17 +19,24 @@ class SimulateGadget(gadget.Gadget):
     """
 
     #--------------------------------------------
-    def __init__(self):
+    def __init__(self, test=None, seed=None, name=None):
+        """
+        test : (str) The test to run, or None for SIM.TEST
+        seed : (int) Its seed, or None for SIM.SEED (where 0 picks one at random)
+        name : (str) The name of the gadget and of its directory in sim, or None for SIM.DIR
+        """
+
         super(SimulateGadget, self).__init__()
 
         self.schedule_phase = 'simulate'
 
-        self.name      = gvars.SIM.DIR
+        self.test      = test if test is not None else gvars.SIM.TEST
+        self.name      = name if name is not None else gvars.SIM.DIR
         self.resources = gvars.PROJ.LSF_SIM_LICS
         self.queue     = 'verilog'
 
-        # ensure that the SIM.TEST exists!
-        test_file = os.path.join('tests', (gvars.SIM.TEST + '.sv'))
+        # ensure that the test exists!
+        test_file = os.path.join('tests', (self.test + '.sv'))
         if not utils.check_files_exist(test_file):
             raise gadget.GadgetFailed("%s is not a legal test." % test_file)
 
@@ -58,13 +65,26 @@ class SimulateGadget(gadget.Gadget):
             self.handle_fsdb()
 
         # set the simulation's seed
-        if gvars.SIM.SEED == 0:
+        self.seed = seed if seed is not None else gvars.SIM.SEED
+        if self.seed == 0:
             import random
-            gvars.SIM.SEED = random.getrandbits(32)
+            self.seed = random.getrandbits(32)
+
+        self.add_gadgets()
+
+        if not os.path.exists(self.sim_dir):
+            try:
+                os.makedirs(self.sim_dir)
+            except OSError:
+                raise gadget.GadgetFailed("Unable to create %s" % self.sim_dir)
+
+    #--------------------------------------------
+    def add_gadgets(self):
+        "Add the gadgets that go along with the simulation."
 
         # create rerun/qrun scripts when we're done
         from gadgets.rerun import RerunGadget
-        rerun = RerunGadget(self.sim_dir)
+        rerun = RerunGadget(self.sim_dir, self.test, self.seed)
         schedule.add_gadget(rerun)
 
         # run simrpt when we're done
@@ -72,12 +92,6 @@ class SimulateGadget(gadget.Gadget):
         simrpt = SimrptGadget(self.sim_dir)
         schedule.add_gadget(simrpt)
 
-        if not os.path.exists(self.sim_dir):
-            try:
-                os.makedirs(self.sim_dir)
-            except OSError:
-                raise gadget.GadgetFailed("Unable to create %s" % self.sim_dir)
-
     #--------------------------------------------
     def create_cmds(self):
         """
@@ -89,9 +103,9 @@ class SimulateGadget(gadget.Gadget):
             raise gadget.GadgetFailed("Simulation Executable %s does not exist." % self.simv_executable)
 
         sim_cmd = self.sim_exe
-        sim_cmd += " +UVM_TESTNAME=%s_test_c" % gvars.SIM.TEST
+        sim_cmd += " +UVM_TESTNAME=%s_test_c" % self.test
         sim_cmd += " -l %s/logfile" % self.sim_dir
-        sim_cmd += " +seed=%d" % gvars.SIM.SEED
+        sim_cmd += " +seed=%d" % self.seed
 
         # options
         sim_cmd += " +UVM_VERBOSITY=%s" % gvars.SIM.DBG
@@ -117,7 +131,7 @@ class SimulateGadget(gadget.Gadget):
             sim_cmd += " +fsdb_siglist=%(sim_dir)s/.signal_list +fsdb_outfile=%(sim_dir)s/verilog.fsdb" % self.__dict__
 
         if gvars.SIM.SVFCOV:
-            cm_name = gvars.SIM.DIR + "." + str(utils.get_time_int())
+            cm_name = self.name + "." + str(utils.get_time_int())
             sim_cmd += " +svfcov=%0d -covg_dump_range -cm_dir coverage/coverage -cm_name %s" % (gvars.SIM.SVFCOV, cm_name)
 
         # add simulation command-line options
@@ -20,6 +20,7 @@ class SsimGadget(gadget.Gadget):
         else:
             self.name = 'ssim'
         self.schedule_phase = 'pre_genip'
+        self.lightweight = True
 
     #--------------------------------------------
     def create_cmds(self):
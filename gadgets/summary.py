@@ -0,0 +1,24 @@
+"""Summarizes the logfile of each run in sim, grouping failures by their signature."""
+
+import gadget
+import glob
+import gvars
+import simlogs
+
+Log = gvars.Log
+
+class SummaryGadget(gadget.Gadget):
+    def __init__(self):
+        super(SummaryGadget, self).__init__()
+
+        self.schedule_phase = 'pre_clean'
+
+        logfiles = glob.glob('sim/*/logfile')
+        if not logfiles:
+            Log.info("There are no logfiles in sim.")
+            return
+
+        simlogs.print_summary(simlogs.scan(logfiles))
+
+    def genCmdLine(self):
+        return []
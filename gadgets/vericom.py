@@ -31,6 +31,10 @@ class VericomGadget(gadget.Gadget):
         except KeyError:
             Log.critical("runmod module verdi was never specified.")
         self.turds.append(self.lib_dir)
+
+        # vericom reads the same sources as vlog, but does not need its results
+        self.predecessors   = ['post_build']
+        self.inputs         = [get_filename('.flist')]
         
     #--------------------------------------------
     def create_cmds(self):
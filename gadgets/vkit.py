@@ -7,11 +7,16 @@ from __future__ import print_function
 import os.path
 import gvars
 import gadget
-from os_utils import touch
 import utils
+import genip_cache
+import time
 
 Log = gvars.Log
 
+# The contents of each vcfg.py file that has been loaded, keyed on file name. Each is (mtime,
+# contents). These outlast a run only in a gogo server (see gogo_server.py).
+VcfgCache = {}
+
 class VkitGadget(gadget.Gadget):
     """
     Represents a vkit
@@ -26,6 +31,9 @@ class VkitGadget(gadget.Gadget):
         # ensure that check_dependencies must only run once
         self.checked_dependencies = None
 
+        # the md5 of the commands, sources, and dependency libraries (see get_content_key)
+        self.content_key = None
+
         # The vkit is either a dictionary, or a vcfg.py file located in the specified path from vkits_dir, 
         # or it's simply a name that can be applied to a default dictionary
         config = {}
@@ -56,19 +64,19 @@ class VkitGadget(gadget.Gadget):
         self.stdoutPath      = utils.get_filename(os.path.join(self.dir_name, '{}.stdout'.format(self.lib_name)))
         self.mergeStderr     = True
         self.genip_done_file = utils.get_filename(os.path.join(self.dir_name, '{}.genip_done'.format(self.lib_name)))
-        self.genip_completed = False
+        self.genip_time_file = utils.get_filename(os.path.join(self.dir_name, '{}.genip_time'.format(self.lib_name)))
+        self.launch_time     = None
         self.pkg_dir         = os.path.join(self.dir_name, self.pkg_name)
         Log.debug("Sending to pkg_dir: {}".format(self.pkg_dir))
 
-        # ensures that the "...waiting for..." message is only printed once per vkit
-        self.printed_waiting_for = False
-
         # in genip mode, run as a gadget, add the ssim gadget to
         # ensure that the synopsys_sim.setup file is created.
+        self.ssim = None
         if gvars.VLOG.COMPTYPE == 'genip':
             import schedule
             import gadgets.ssim
-            schedule.add_gadget(gadgets.ssim.SsimGadget(self))
+            self.ssim = gadgets.ssim.SsimGadget(self)
+            schedule.add_gadget(self.ssim)
 
     #--------------------------------------------
     def make_assignments(self, config, entry):
@@ -123,15 +131,24 @@ class VkitGadget(gadget.Gadget):
             self.VLOG = Vlog()
 
     #--------------------------------------------
-    def load_vcfg(self, entry):
+    @staticmethod
+    def load_vcfg(entry):
         """
         The entry represents a vcfg.py file. Import it and use its dictionary to get 
-        values for this vkit.
+        values for this vkit. A file is only imported again once its mtime changes.
         """
 
         import imp
         import sys
 
+        fname = os.path.abspath(entry)
+        try:
+            mtime = os.path.getmtime(fname)
+        except OSError:
+            mtime = None
+        if fname in VcfgCache and VcfgCache[fname][0] == mtime:
+            return VcfgCache[fname][1].copy()
+
         mod_name,ext = os.path.splitext(os.path.basename(entry))
         try:
             mod = imp.load_source(mod_name , entry)
@@ -144,7 +161,8 @@ class VkitGadget(gadget.Gadget):
         result = mod.__dict__.copy()
         del sys.modules[mod_name]
         Log.debug("Loaded cfg:\n{}".format(result))
-        return result
+        VcfgCache[fname] = (mtime, result)
+        return result.copy()
 
     #--------------------------------------------
     def __repr__(self):
@@ -165,17 +183,23 @@ class VkitGadget(gadget.Gadget):
     #--------------------------------------------
     def get_all_sources(self, patterns=['.sv', '.v', '.svh']):
         """
-        Returns a list of ALL files in the vkit directory.
+        Returns the vkit's flist and all of the files that it names or `includes. If the vkit has
+        no flist, returns ALL files in the vkit directory that match the patterns, and the files
+        that they `include.
         """
 
-        from pymake import glob_files
-        patterns = ['*{}'.format(it) for it in patterns]
-        srcs = glob_files([self.dir_name], patterns, recursive=True)
+        import flists
+
+        if os.path.exists(self.flist_name):
+            return flists.get_sources([self.flist_name], self.dir_name)
+
+        from pymake import find_files
 
-        # remove any sv files that VCS creates during genip 
-        srcs = [it for it in srcs if not it.startswith(self.pkg_dir)]
+        # skip over any sv files that VCS creates during genip
+        srcs = find_files([self.dir_name], patterns, prune=[self.pkg_dir])
 
-        return srcs
+        # along with any headers outside of the vkit that they include
+        return sorted(flists.follow_includes([it[0] for it in srcs], [], self.dir_name))
 
     #--------------------------------------------
     def create_cmds(self):
@@ -186,7 +210,7 @@ class VkitGadget(gadget.Gadget):
         cmds = []
 
         # the vkits of our dependencies
-        Log.debug("Getting the vkits for: {} with dependencies: {}".format((self.lib_name, self.dependencies)))
+        Log.debug("Getting the vkits for: {} with dependencies: {}".format(self.lib_name, self.dependencies))
         self.libs = gvars.get_vkits(self.dependencies, False)
 
         import vlog
@@ -197,15 +221,15 @@ class VkitGadget(gadget.Gadget):
         so_files      = vlog.get_so_files(self.VLOG.SO_FILES)
         arc_libs      = vlog.get_arc_libs(self.VLOG.ARC_LIBS)
         parallel      = vlog.get_parallel()
-        work_arg      = '-work {}' % self.lib_name
-        sharedlib     = '-sharedlib={}' % ':'.join([it.pkg_dir for it in self.libs]) if self.libs else ''
-        vcs_dir       = '-dir={}' % self.pkg_name
-        genip_cmd     = '-genip {}.{} -lca' % (self.lib_name, self.pkg_name) 
+        work_arg      = '-work {}'.format(self.lib_name)
+        sharedlib     = '-sharedlib={}'.format(':'.join([it.pkg_dir for it in self.libs])) if self.libs else ''
+        vcs_dir       = '-dir={}'.format(self.pkg_name)
+        genip_cmd     = '-genip {}.{} -lca'.format(self.lib_name, self.pkg_name)
 
         # set env variables for VCS
         # setenv SYNOPSYS_SIM_SETUP name.setup
-        cmds.append(gadget.GadgetCommand(command="setenv SYNOPSYS_SIM_SETUP {}.setup".format(self.name, check_after=False, no_modules=True)))
-        cmds.append(gadget.GadgetCommand(command="setenv VCS_UVM_HOME project/verif/vkits/uvm/{}/src".format(gvars.PROJ.UVM_REV, check_after=False, no_modules=True)))
+        cmds.append(gadget.GadgetCommand(command="setenv SYNOPSYS_SIM_SETUP {}.setup".format(self.name), check_after=False, no_modules=True))
+        cmds.append(gadget.GadgetCommand(command="setenv VCS_UVM_HOME project/verif/vkits/uvm/{}/src".format(gvars.PROJ.UVM_REV), check_after=False, no_modules=True))
 
         # create vlogan command
         vlogan_args   = [vlog_warnings, gvars.VLOG.OPTIONS, self.VLOG.OPTIONS, '-nc +vcsd', gvars.VLOG.VLOGAN_OPTIONS, 
@@ -223,21 +247,20 @@ class VkitGadget(gadget.Gadget):
         return cmds
 
     #--------------------------------------------
-    def pauseJob(self):
-        "Return true if any dependent libs are not yet done."
-
-        dependent_libs = [it for it in self.libs if not (it.doNotLaunch or it.genip_completed)]
-        if dependent_libs:
-            if not self.printed_waiting_for:
-                # ensure that these things only get printed once
-                Log.info("{} waiting for {}".format((self.name, dependent_libs)))
-                self.printed_waiting_for = True
-            return True
-        else:
-            return False
+    def get_predecessors(self):
+        """
+        A vkit follows the build phase, its own synopsys_sim.setup file, and the vkits it depends
+        upon. It need not wait for any other vkit.
+        """
+
+        result = ['post_build'] + gvars.get_vkits(self.dependencies)
+        if self.ssim is not None:
+            result.append(self.ssim)
+        return result
 
     #--------------------------------------------
     def preLaunchCallback(self):
+        super(VkitGadget, self).preLaunchCallback()
 
         # ensure that the project link exists
         try:
@@ -245,23 +268,24 @@ class VkitGadget(gadget.Gadget):
         except OSError:
             pass
 
-        # If there are any libraries that this vkit depends on, then wait until they have completed
         Log.info("{} Launching!".format(self.name))
+        self.launch_time = time.time()
 
     #--------------------------------------------
     def completedCallback(self):
-        # ensure that this does not get launched again by waitForSomeJobs call in another vkit's preLaunchCallback
-        self.genip_completed = True;
-
         # if this job did not actually launch, then don't call getExitStatus
         if self.doNotLaunch:
+            self.mark_completed()
             return
 
         Log.info("{} genip completed!".format(self.name))
         exit_status = self.getExitStatus()
+
+        # ensure that this does not get launched again, and that vkits that depend upon it may go
+        self.mark_completed(exit_status)
         if exit_status != 0:
             import sync_nfs
-            Log.info("{} We are going down because of me! exit_status=%0d".format((self.name, exit_status)))
+            Log.info("{} We are going down because of me! exit_status={}".format(self.name, exit_status))
             try:
                 with sync_nfs.sync_open(self.stdoutPath) as f:
                     lines = f.readlines()
@@ -271,33 +295,67 @@ class VkitGadget(gadget.Gadget):
                 print(line, end="")
             if os.path.exists(self.genip_done_file):
                 os.remove(self.genip_done_file)
-            raise gadget.GadgetFailed("genip of {} failed with exit status %0d. See {}".format((self.name, exit_status, self.stdoutPath)))
+            raise gadget.GadgetFailed("genip of {} failed with exit status {}. See {}".format(self.name, exit_status, self.stdoutPath))
         else:
+            # the done file records the key that the library was built with
             try:
-                touch(self.genip_done_file)
+                genip_cache.write_key(self.genip_done_file, self.get_content_key())
             except IOError:
-                Log.critical("Unable to touch file {}".format(self.genip_done_file))
+                Log.critical("Unable to write file {}".format(self.genip_done_file))
+            genip_cache.publish(self.name, self.pkg_dir, self.get_content_key())
+            if self.launch_time is not None:
+                self.record_build_time(time.time() - self.launch_time)
+
+    #--------------------------------------------
+    def get_content_key(self):
+        "Returns the md5 key of this vkit's build commands, its sources, and its dependency libraries."
+
+        if self.content_key is None:
+            commands = []
+            for cmd in self.create_cmds():
+                commands.extend(cmd.get_lines(self.runmod_modules))
+
+            sources = self.get_all_sources()
+
+            dep_keys = [it.get_content_key() for it in self.libs]
+            self.content_key = genip_cache.calc_key(commands, sources, dep_keys)
+            genip_cache.save_file_hashes()
+            Log.debug("{} has content key {}".format(self.name, self.content_key))
+        return self.content_key
 
     #--------------------------------------------
     def check_dependencies(self):
+        """
+        Returns True if the library must be built. It is up to date if it was last built with
+        the same content key. Otherwise, the current library is stashed in the genip cache, and
+        one that was previously built with the same key is restored from it, if available.
+        """
+
         if self.checked_dependencies is not None:
             return self.checked_dependencies
 
-        import pymake
-        targets = self.genip_done_file
-        sources = self.get_all_sources()
-        answer = pymake.pymake(targets, sources, get_cause=True)
-        Log.debug("dependencies of {} say {} because {}".format(self.name, answer.result, answer.cause))
-        result = answer.result
-
-        # also check any of our dependency libraries
-        if not result:
-            self.libs = gvars.get_vkits(self.dependencies)
-            for lib in self.libs:
-                if lib.check_dependencies():
-                    result = True
-                    Log.debug("{} will be built because of {}".format((self.name, lib.name)))
-                    break
+        key = self.get_content_key()
+        built_key = genip_cache.read_key(self.genip_done_file)
+
+        if key == built_key and os.path.isdir(self.pkg_dir):
+            Log.debug("{} is up to date".format(self.name))
+            result = False
+        else:
+            genip_cache.stash(self.name, self.pkg_dir, built_key)
+            if genip_cache.restore(self.name, self.pkg_dir, key):
+                Log.info("{} restored from the genip cache".format(self.name))
+                result = False
+            elif genip_cache.fetch(self.name, self.pkg_dir, key):
+                Log.info("{} fetched from {}".format(self.name, gvars.PROJ.GENIP_STORE))
+                result = False
+            else:
+                Log.debug("{} will be built because its key changed from {} to {}".format(self.name, built_key, key))
+                # never build into a library that is linked from the GENIP_STORE
+                genip_cache.remove_lib(self.pkg_dir)
+                result = True
+
+            if result == False:
+                genip_cache.write_key(self.genip_done_file, key)
 
         # this ensures that any job that calls waitForSomeJobs() will not try to launch this
         if result == False:
@@ -305,6 +363,29 @@ class VkitGadget(gadget.Gadget):
         self.checked_dependencies = result
         return result
 
+    #--------------------------------------------
+    def get_build_time(self):
+        "Returns the average number of seconds this vkit has taken to build, or None if unknown."
+
+        try:
+            with open(self.genip_time_file) as tfile:
+                return float(tfile.read())
+        except (IOError, ValueError):
+            return None
+
+    #--------------------------------------------
+    def record_build_time(self, seconds):
+        "Average a new build time in with the previous ones."
+
+        previous = self.get_build_time()
+        if previous is not None:
+            seconds = (previous + seconds) / 2.0
+        try:
+            with open(self.genip_time_file, 'w') as tfile:
+                print("{:.1f}".format(seconds), file=tfile)
+        except IOError:
+            Log.debug("Unable to write {}".format(self.genip_time_file))
+
     #--------------------------------------------
     def cleanup(self):
         "Report back any directories and/or files that should be cleaned up from this vkit."
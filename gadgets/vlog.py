@@ -3,9 +3,13 @@ Compiles the verilog for a testbench.
 """
 
 import gadget
+import genip_cache
 import gvars
+import hashlib
+import json
 import os
 import schedule
+import utils
 from utils import check_files_exist, get_filename
 
 Log = gvars.Log
@@ -43,6 +47,14 @@ class VlogGadget(gadget.Gadget):
         import flist
         schedule.add_gadget(flist.FlistGadget())
 
+        # the commands, once create_cmds has been called
+        self.cmds = None
+
+        # the stamp next to the simv records the fingerprint of the inputs that it was built from
+        self.simv_name = os.path.join(gvars.VLOG.VCOMP_DIR, 'simv')
+        self.stamp_name = self.simv_name + '.stamp'
+        self.fingerprint = None
+
         self.run_partition = gvars.VLOG.COMPTYPE == 'partition'
         self.run_genip = gvars.VLOG.COMPTYPE == 'genip'
         self.run_normal = gvars.VLOG.COMPTYPE == 'normal'
@@ -72,12 +84,97 @@ class VlogGadget(gadget.Gadget):
             cmd_line += ' -pe smp_pe %d' % int(gvars.VLOG.PARALLEL)
         return cmd_line
 
+    #--------------------------------------------
+    def check_dependencies(self):
+        """
+        Returns True if the simv must be built: if it does not exist, or if any of its inputs
+        differ from those recorded in the stamp next to it. Logs which input forced the build.
+        """
+
+        self.fingerprint = self.get_fingerprint()
+
+        if not os.path.exists(self.simv_name):
+            cause = "%s does not exist" % self.simv_name
+        else:
+            cause = get_change(read_stamp(self.stamp_name), self.fingerprint)
+
+        if cause is None:
+            Log.info("%s is up to date." % self.simv_name)
+            return False
+
+        Log.info("Running vlog because %s." % cause)
+
+        # a build that does not complete must not leave the old stamp behind
+        if os.path.exists(self.stamp_name):
+            os.remove(self.stamp_name)
+        return True
+
+    #--------------------------------------------
+    def completedCallback(self):
+        super(VlogGadget, self).completedCallback()
+
+        # only reached if the build passed
+        if self.fingerprint is not None:
+            write_stamp(self.stamp_name, self.fingerprint)
+
+    #--------------------------------------------
+    def get_fingerprint(self):
+        """
+        Returns a dict with the hash of each input of the simv: its command lines, every file that
+        it is built from, and (in genip mode) the key of each vkit library.
+        """
+
+        md5 = hashlib.md5()
+        for cmd in self.create_cmds():
+            for line in cmd.get_lines(self.runmod_modules):
+                md5.update(line + '\n')
+        fingerprint = {'the command line': md5.hexdigest()}
+
+        for fname in self.get_input_files():
+            try:
+                fingerprint[fname] = genip_cache.hash_file(fname)
+            except (IOError, OSError):
+                fingerprint[fname] = 'missing'
+
+        if self.run_genip:
+            for vkit in gvars.Vkits:
+                fingerprint['the genip library of %s' % vkit.name] = vkit.get_content_key()
+
+        genip_cache.save_file_hashes()
+        return fingerprint
+
+    #--------------------------------------------
+    def get_input_files(self):
+        "Returns the absolute names of all the files that the simv is built from."
+
+        import flists
+
+        all_flists = [get_filename('.flist')] + gvars.TB.FLISTS
+        if not self.run_genip:
+            all_flists += [it.flist_name for it in gvars.Vkits]
+
+        files = set(flists.get_sources(all_flists))
+        files.update(utils.get_all_sources())
+        files.update(gvars.VLOG.TAB_FILES + gvars.VLOG.SO_FILES)
+        files.update([it for it in gvars.VLOG.ARC_LIBS if os.path.isfile(it)])
+        if self.run_partition:
+            files.add(get_filename(gvars.VLOG.PART_CFG))
+
+        return sorted(set(os.path.abspath(it) for it in files))
+
     #--------------------------------------------
     def create_cmds(self):
         """
         Returns the commands as a list of strings.
         """
 
+        # these are only created once, because doing so adds to VLOG.VCS_OPTIONS
+        if self.cmds is None:
+            self.cmds = self.make_cmds()
+        return self.cmds
+
+    #--------------------------------------------
+    def make_cmds(self):
         cmds = []
 
         #--------------------------------------------
@@ -159,7 +256,45 @@ class VlogGadget(gadget.Gadget):
 # Externally Available Functions
 ########################################################################################
 
-# TODO: Put this in a vcs_utils file?
+########################################################################################
+def read_stamp(stamp_name):
+    "Returns the fingerprint recorded in a stamp file, or None."
+
+    try:
+        with open(stamp_name) as sfile:
+            return json.load(sfile)
+    except (IOError, ValueError):
+        return None
+
+########################################################################################
+def write_stamp(stamp_name, fingerprint):
+    tmp_name = "%s.%d" % (stamp_name, os.getpid())
+    try:
+        with open(tmp_name, 'w') as sfile:
+            json.dump(fingerprint, sfile, indent=1, sort_keys=True)
+        os.rename(tmp_name, stamp_name)
+    except (IOError, OSError) as exc:
+        Log.warning("Unable to write %s: %s" % (stamp_name, exc))
+
+########################################################################################
+def get_change(stamp, fingerprint):
+    """
+    Returns a description of the first difference between the fingerprint recorded in a stamp and
+    the current one, or None if they are the same.
+    """
+
+    if stamp is None:
+        return "there is no record of the inputs of the last build"
+
+    for name in sorted(fingerprint):
+        if name not in stamp:
+            return "%s was added" % name
+        if stamp[name] != fingerprint[name]:
+            return "%s changed" % name
+    for name in sorted(stamp):
+        if name not in fingerprint:
+            return "%s was removed" % name
+    return None
 
 ########################################################################################
 def get_warnings(warnings):
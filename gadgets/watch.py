@@ -0,0 +1,419 @@
+"""
+Rebuilds the testbench each time its sources change, until Ctrl-C.
+"""
+
+import gvars
+import gadget
+import os
+import signal
+import subprocess
+import sys
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+Log = gvars.Log
+
+# Files with these suffixes are sources, even before any flist names them
+SOURCE_SUFFIXES = ('.sv', '.svh', '.v', '.vh', '.flist', '.f')
+
+# The most directories that are watched with inotify
+MAX_WATCHES = 8192
+
+# How often the mtimes of the sources are polled, in seconds, when inotify_simple is not installed
+POLL = 1.0
+
+# How long a rebuild is given to see the same Ctrl-C as this process, in seconds, before it is
+# sent one of its own
+CTRL_C_GRACE = 2.0
+
+# How long a cancelled rebuild is given to exit after each of Ctrl-C (as it kills its jobs) and
+# SIGTERM, in seconds, before it is sent the next signal
+CANCEL_GRACE = 10.0
+
+class WatchGadget(gadget.Gadget):
+    """
+    Watches the directories of every vkit, of the testbench's flists (TB.FLISTS), and tests, with
+    inotify. Once changes to sources stop for PROJ.WATCH_DEBOUNCE seconds, runs gogo again with
+    genip of only the vkits that the changes affect (in genip mode), vlog, and then TB.WATCH_TEST,
+    if any. If more changes come in while that runs, it is cancelled (as with Ctrl-C), and started
+    over with all of the changes.
+
+    A change to project.py, tb.py, or any vcfg.py starts gogo watch over.
+    """
+
+    #--------------------------------------------
+    def __init__(self):
+        super(WatchGadget, self).__init__()
+
+        self.name = 'watch'
+        self.schedule_phase = 'pre_clean'
+
+        # the sources of each vkit, keyed on vkit name, and those of the testbench itself
+        self.vkit_sources = {}
+        self.tb_sources = set()
+
+        # the files that have changed since the last rebuild started (the dirty set), those that
+        # the rebuild in progress is for, and those of a rebuild that failed
+        self.dirty = set()
+        self.building = set()
+        self.failed = set()
+
+        # the rebuild in progress (a Popen), and when it started
+        self.proc = None
+        self.start_time = None
+
+        # the inotify instance, and the directory of each of its watches
+        self.inotify = None
+        self.watches = {}
+
+        # the mtime of each source, when polling instead
+        self.mtimes = {}
+
+        # the directories that hold files that gogo generates, which are never watched
+        self.generated_dirs = [it.pkg_dir for it in gvars.Vkits]
+        self.generated_dirs.append(os.path.abspath(gvars.VLOG.VCOMP_DIR or 'vcomp'))
+        self.generated_dirs.extend([os.path.abspath(it) for it in gvars.PROJ.CLEAN_DIRS])
+
+        self.config_files = self.get_config_files()
+
+    #--------------------------------------------
+    def prepare(self):
+        "Watch, and rebuild, until Ctrl-C, which ends gogo watch as a success."
+
+        try:
+            self.watch()
+        except KeyboardInterrupt:
+            Log.info("Stopped watching.")
+
+    #--------------------------------------------
+    def get_config_files(self):
+        "Returns the absolute names of project.py, tb.py, and the vcfg.py file of each vkit."
+
+        result = set()
+        for mod_name in ('project', gvars.Options.tb):
+            fname = getattr(sys.modules.get(mod_name), '__file__', None)
+            if fname:
+                result.add(os.path.splitext(os.path.abspath(fname))[0] + '.py')
+        for entry in gvars.TB.VKITS:
+            if isinstance(entry, str) and entry.endswith('.py'):
+                result.add(os.path.abspath(entry))
+        return result
+
+    #--------------------------------------------
+    def watch(self):
+        "Watch, and rebuild, until Ctrl-C."
+
+        for vkit in gvars.Vkits:
+            self.find_vkit_sources(vkit)
+        self.find_tb_sources()
+        self.watch_all()
+
+        # everything is checked once at the start
+        self.dirty.add(None)
+        last_change = 0
+        try:
+            while True:
+                changes = self.read_changes(self.get_timeout(last_change))
+                if changes & self.config_files:
+                    self.restart(changes & self.config_files)
+                if changes:
+                    self.dirty.update(changes)
+                    last_change = time.time()
+
+                if self.proc is not None and self.proc.poll() is not None:
+                    self.finish()
+
+                if self.dirty and time.time() - last_change >= gvars.PROJ.WATCH_DEBOUNCE:
+                    if self.proc is not None:
+                        self.cancel()
+                    self.rebuild()
+        except KeyboardInterrupt:
+            if self.proc is not None:
+                self.cancel(CTRL_C_GRACE)
+            raise
+
+    #--------------------------------------------
+    def get_timeout(self, last_change):
+        "Returns how long to wait for changes before the next rebuild may be due."
+
+        timeout = POLL if self.inotify is None else 60
+        if self.dirty:
+            timeout = min(timeout, max(0, last_change + gvars.PROJ.WATCH_DEBOUNCE - time.time()))
+        if self.proc is not None:
+            timeout = min(timeout, 0.5)
+        return timeout
+
+    #--------------------------------------------
+    def find_vkit_sources(self, vkit):
+        try:
+            self.vkit_sources[vkit.name] = set(vkit.get_all_sources())
+        except Exception as exc:
+            # such as an flist broken mid-edit, which the rebuild will report
+            Log.debug("Unable to find the sources of %s: %s" % (vkit.name, exc))
+
+    #--------------------------------------------
+    def find_tb_sources(self):
+        import flists
+
+        try:
+            self.tb_sources = set(flists.get_sources(gvars.TB.FLISTS))
+        except Exception as exc:
+            Log.debug("Unable to find the sources of the testbench: %s" % exc)
+
+    #--------------------------------------------
+    def get_all_sources(self):
+        result = set(self.tb_sources)
+        for sources in self.vkit_sources.values():
+            result.update(sources)
+        return result
+
+    #--------------------------------------------
+    def is_generated(self, path):
+        return any(path == it or path.startswith(it + os.sep) for it in self.generated_dirs)
+
+    #--------------------------------------------
+    def is_source(self, path):
+        "Returns True if a change to path could change the build."
+
+        if path in self.config_files or path in self.tb_sources:
+            return True
+        if any(path in it for it in self.vkit_sources.values()):
+            return True
+        return path.endswith(SOURCE_SUFFIXES) and not self.is_generated(path)
+
+    #--------------------------------------------
+    def watch_all(self):
+        """
+        Watch the directory tree of each vkit and of tests, and the directory of every source and
+        configuration file. Without inotify_simple, poll the mtimes of the sources instead.
+        """
+
+        if inotify_simple is None:
+            Log.warning("inotify_simple is not installed, so only changes to the %d known sources will be seen." %
+                        len(self.get_all_sources()))
+            self.mtimes = self.poll_mtimes()
+            return
+
+        try:
+            self.inotify = inotify_simple.INotify()
+        except OSError as exc:
+            Log.critical("Unable to watch for changes: %s" % exc)
+
+        for vkit in gvars.Vkits:
+            self.watch_tree(vkit.dir_name)
+        self.watch_tree(os.path.abspath('tests'))
+        for fname in self.get_all_sources() | self.config_files | set(map(os.path.abspath, gvars.TB.FLISTS)):
+            self.watch_dir(os.path.dirname(fname))
+        Log.info("Watching %d directories for changes." % len(self.watches))
+
+    #--------------------------------------------
+    def watch_tree(self, top):
+        "Watch a directory and all of its subdirectories, except those that gogo generates."
+
+        for dirname, subdirs, _ in os.walk(top):
+            subdirs[:] = [it for it in subdirs if not it.startswith('.')
+                          and not self.is_generated(os.path.join(dirname, it))]
+            self.watch_dir(dirname)
+
+    #--------------------------------------------
+    def watch_dir(self, dirname):
+        if dirname in self.watches.values() or not os.path.isdir(dirname):
+            return
+        if len(self.watches) >= MAX_WATCHES:
+            Log.debug("Not watching %s, since %d directories already are." % (dirname, MAX_WATCHES))
+            return
+
+        flags = inotify_simple.flags
+        mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.CREATE | flags.DELETE
+        try:
+            self.watches[self.inotify.add_watch(dirname, mask)] = dirname
+        except OSError as exc:
+            # such as when out of watches
+            Log.debug("Unable to watch %s: %s" % (dirname, exc))
+
+    #--------------------------------------------
+    def read_changes(self, timeout):
+        "Returns the set of sources that have changed, after waiting up to timeout seconds for any."
+
+        if self.inotify is None:
+            time.sleep(timeout)
+            mtimes = self.poll_mtimes()
+            changes = set(fname for fname in set(mtimes) | set(self.mtimes)
+                          if mtimes.get(fname) != self.mtimes.get(fname))
+            self.mtimes = mtimes
+            return changes
+
+        import pymake
+
+        changes = set()
+        index = pymake.load_index()
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            dirname = self.watches.get(event.wd)
+            if dirname is None:
+                continue
+
+            # its listing is out of date
+            index.pop(dirname, None)
+
+            path = os.path.join(dirname, event.name)
+            if event.mask & inotify_simple.flags.ISDIR:
+                if event.mask & inotify_simple.flags.CREATE and not self.is_generated(path):
+                    self.watch_tree(path)
+            elif self.is_source(path):
+                changes.add(path)
+        return changes
+
+    #--------------------------------------------
+    def poll_mtimes(self):
+        import pymake
+
+        sources = sorted(self.get_all_sources() | self.config_files)
+        return pymake.stat_mtimes(sources)
+
+    #--------------------------------------------
+    def get_affected_vkits(self, changes):
+        """
+        Returns the names of the vkits whose libraries the changes could affect: those with a
+        changed source, or a changed file in their directory, and all that depend upon those.
+        """
+
+        names = set()
+        for vkit in gvars.Vkits:
+            sources = self.vkit_sources.get(vkit.name, set())
+            prefix = vkit.dir_name + os.sep
+            if any(it in sources or it.startswith(prefix) for it in changes):
+                names.add(vkit.name)
+
+        growing = True
+        while growing:
+            growing = False
+            for vkit in gvars.Vkits:
+                if vkit.name not in names and names.intersection(vkit.dependencies):
+                    names.add(vkit.name)
+                    growing = True
+        return names
+
+    #--------------------------------------------
+    def get_args(self, changes):
+        "Returns the command-line of the gogo that rebuilds after the changes."
+
+        gogo = os.path.join(os.path.dirname(os.path.abspath(gvars.__file__)), 'gogo')
+        args = [sys.executable, gogo, '--tb', gvars.Options.tb]
+        if gvars.Options.dbg:
+            args.append('--dbg')
+        if gvars.Options.noflush:
+            args.append('--noflush')
+
+        gadgets = []
+        if gvars.VLOG.COMPTYPE == 'genip':
+            if None in changes:
+                vkits = [it.name for it in gvars.Vkits]
+            else:
+                vkits = sorted(self.get_affected_vkits(changes))
+            if vkits:
+                args.extend(['--only-vkits', ','.join(vkits)])
+                gadgets.append('genip')
+
+        args.extend(gvars.CommandLineVariables + gadgets)
+        args.append('vlog')
+        if gvars.TB.WATCH_TEST:
+            args.extend(['sim', 'TEST=%s' % gvars.TB.WATCH_TEST])
+        return args
+
+    #--------------------------------------------
+    def rebuild(self):
+        "Start a gogo that rebuilds after the changes in the dirty set (and any that failed)."
+
+        self.building = self.dirty | self.failed
+        self.dirty = set()
+        self.failed = set()
+
+        changed = sorted(it for it in self.building if it is not None)
+        if changed:
+            Log.info("Rebuilding after changes to: %s" % ' '.join([os.path.relpath(it) for it in changed]))
+        args = self.get_args(self.building)
+        Log.debug("Running %s" % ' '.join(args[1:]))
+        self.start_time = time.time()
+        self.proc = subprocess.Popen(args)
+
+    #--------------------------------------------
+    def finish(self):
+        "Once the rebuild has exited, find the sources of what it rebuilt again."
+
+        status = self.proc.returncode
+        self.proc = None
+
+        if status:
+            Log.error("The rebuild failed with exit status %d. Waiting for changes..." % status)
+            self.failed = self.building
+        else:
+            Log.info("The rebuild passed in %.1fs. Waiting for changes..." % (time.time() - self.start_time))
+
+        # new files may have been added to the flists, and new `includes to sources
+        if None in self.building:
+            rebuilt = [it.name for it in gvars.Vkits]
+        else:
+            rebuilt = self.get_affected_vkits(self.building)
+        for vkit in gvars.Vkits:
+            if vkit.name in rebuilt:
+                self.find_vkit_sources(vkit)
+        self.find_tb_sources()
+        if self.inotify is not None:
+            for fname in self.get_all_sources():
+                self.watch_dir(os.path.dirname(fname))
+        self.building = set()
+
+    #--------------------------------------------
+    def cancel(self, grace=0):
+        """
+        Cancel the rebuild in progress as Ctrl-C would, which kills its jobs, and wait for it to
+        exit. Its changes are rebuilt the next time. Given a grace period, it is first given that
+        long to exit by itself. If it does not exit within CANCEL_GRACE of Ctrl-C, it is sent
+        SIGTERM, and then SIGKILL.
+        """
+
+        self.wait_for_rebuild(grace)
+        for signum, signame in ((signal.SIGINT, 'Ctrl-C'), (signal.SIGTERM, 'SIGTERM'), (signal.SIGKILL, 'SIGKILL')):
+            if self.proc.poll() is not None:
+                break
+            if signum == signal.SIGINT:
+                Log.info("Cancelling the rebuild in progress.")
+            else:
+                Log.warning("The rebuild in progress has not exited, so sending it %s." % signame)
+            try:
+                os.kill(self.proc.pid, signum)
+            except OSError:
+                pass
+            self.wait_for_rebuild(CANCEL_GRACE)
+        self.proc.wait()
+
+        self.dirty.update(self.building)
+        self.building = set()
+        self.proc = None
+
+    #--------------------------------------------
+    def wait_for_rebuild(self, timeout):
+        "Wait for the rebuild in progress to exit, for up to timeout seconds."
+
+        stop_time = time.time() + timeout
+        while self.proc.poll() is None and time.time() < stop_time:
+            time.sleep(0.1)
+
+    #--------------------------------------------
+    def restart(self, changed):
+        "Start gogo watch over, so that the changed configuration files are read again."
+
+        Log.info("%s changed, so starting over." % ' '.join([os.path.relpath(it) for it in sorted(changed)]))
+        if self.proc is not None:
+            self.cancel()
+        if self.inotify is not None:
+            self.inotify.close()
+
+        gogo = os.path.join(os.path.dirname(os.path.abspath(gvars.__file__)), 'gogo')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable, gogo] + sys.argv[1:])
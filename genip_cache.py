@@ -0,0 +1,264 @@
+"""
+A content-addressed cache of genip libraries.
+
+Each vkit library is keyed on the md5 of the commands that build it, the contents of its sources,
+and the keys of the libraries that it depends upon. When a library is about to be replaced by one
+with a different key, it is stashed in the cache under its old key. Returning to the old flags or
+sources then restores the prebuilt library instead of recompiling it.
+
+If PROJ.GENIP_STORE names a shared directory, libraries are also published there once built, so
+that any workspace whose vkit has the same key may link to (or copy) it instead of compiling.
+"""
+
+from __future__ import print_function
+
+import gvars
+import hashlib
+import json
+import os
+import shutil
+import socket
+
+# The md5 of each file, keyed on filename. Each value is [mtime, size, md5].
+FileHashes = None
+
+# Set when FileHashes must be written back to disk
+HashesChanged = False
+
+########################################################################################
+def get_cache_dir(name=None):
+    "Returns the directory of the genip cache, or that of the given vkit within it."
+
+    cache_dir = os.path.join(gvars.GogoDir, 'genip_cache')
+    if name:
+        cache_dir = os.path.join(cache_dir, name)
+    return cache_dir
+
+########################################################################################
+def get_hashes_filename():
+    return os.path.join(gvars.GogoDir, 'file_hashes.json')
+
+########################################################################################
+def load_file_hashes():
+    "Returns the FileHashes, reading them from .gogo the first time."
+
+    global FileHashes
+
+    if FileHashes is None:
+        try:
+            with open(get_hashes_filename()) as hfile:
+                FileHashes = json.load(hfile)
+        except (IOError, ValueError):
+            FileHashes = {}
+    return FileHashes
+
+########################################################################################
+def save_file_hashes():
+    "Write the FileHashes back to .gogo, if any have changed."
+
+    global HashesChanged
+
+    if not HashesChanged:
+        return
+
+    fname = get_hashes_filename()
+    tmp_name = "%s.%d" % (fname, os.getpid())
+    try:
+        if not os.path.exists(gvars.GogoDir):
+            os.mkdir(gvars.GogoDir)
+        with open(tmp_name, 'w') as hfile:
+            json.dump(FileHashes, hfile)
+        os.rename(tmp_name, fname)
+    except (IOError, OSError) as exc:
+        gvars.Log.debug("Unable to save %s: %s" % (fname, exc))
+    HashesChanged = False
+
+########################################################################################
+def hash_file(fname):
+    """
+    Returns the md5 of the contents of fname. Files are only re-read when their mtime or size
+    has changed, so touching a file without editing it does not change its hash.
+    """
+
+    global HashesChanged
+
+    hashes = load_file_hashes()
+    stat = os.stat(fname)
+    try:
+        mtime, size, md5 = hashes[fname]
+        if mtime == stat.st_mtime and size == stat.st_size:
+            return md5
+    except (KeyError, ValueError):
+        pass
+
+    md5 = hashlib.md5()
+    with open(fname, 'rb') as afile:
+        for chunk in iter(lambda: afile.read(1 << 20), b''):
+            md5.update(chunk)
+    hashes[fname] = [stat.st_mtime, stat.st_size, md5.hexdigest()]
+    HashesChanged = True
+    return hashes[fname][2]
+
+########################################################################################
+def calc_key(commands, sources, dep_keys):
+    """
+    Returns the content key of a library.
+
+    commands : (list of str) The lines of the script that builds the library
+    sources  : (list of str) All of the source files of the library
+    dep_keys : (list of str) The keys of the libraries that it depends upon
+    =>       : (str) An md5 hex digest
+    """
+
+    md5 = hashlib.md5()
+
+    # paths are made relative to the project, so that the key is the same in any workspace
+    for line in commands:
+        md5.update(line.replace(gvars.RootDir, 'project') + '\n')
+
+    for fname in sorted(sources):
+        md5.update("%s %s\n" % (os.path.relpath(fname, gvars.RootDir), hash_file(fname)))
+
+    for key in dep_keys:
+        md5.update("%s\n" % key)
+
+    return md5.hexdigest()
+
+########################################################################################
+def read_key(done_file):
+    "Returns the key that a library was last built with, or None."
+
+    try:
+        with open(done_file) as dfile:
+            return dfile.read().strip() or None
+    except IOError:
+        return None
+
+########################################################################################
+def write_key(done_file, key):
+    with open(done_file, 'w') as dfile:
+        print(key, file=dfile)
+
+########################################################################################
+def stash(name, pkg_dir, key):
+    """
+    Move the library in pkg_dir into the cache under the key that it was built with.
+    """
+
+    if not key or not os.path.isdir(pkg_dir) or gvars.PROJ.GENIP_CACHE_SIZE <= 0:
+        return
+
+    entry = os.path.join(get_cache_dir(name), key)
+    if os.path.exists(entry):
+        return
+
+    try:
+        os.makedirs(get_cache_dir(name))
+    except OSError:
+        pass
+
+    gvars.Log.debug("Stashing %s in %s" % (pkg_dir, entry))
+    shutil.move(pkg_dir, entry)
+    os.utime(entry, None)
+    prune(name)
+
+########################################################################################
+def restore(name, pkg_dir, key):
+    """
+    Move the library with the given key from the cache into pkg_dir.
+    Returns True if it was found.
+    """
+
+    entry = os.path.join(get_cache_dir(name), key)
+    if not os.path.isdir(entry):
+        return False
+
+    gvars.Log.debug("Restoring %s from %s" % (pkg_dir, entry))
+    remove_lib(pkg_dir)
+    shutil.move(entry, pkg_dir)
+    return True
+
+########################################################################################
+def remove_lib(pkg_dir):
+    "Remove a library directory, or the link to one in the GENIP_STORE."
+
+    if os.path.islink(pkg_dir):
+        os.remove(pkg_dir)
+    elif os.path.isdir(pkg_dir):
+        shutil.rmtree(pkg_dir)
+
+########################################################################################
+def get_store_entry(name, key):
+    "Returns the directory in the GENIP_STORE of the library with this key, or None if there is no store."
+
+    if not gvars.PROJ.GENIP_STORE:
+        return None
+    return os.path.join(gvars.PROJ.GENIP_STORE, name, key)
+
+########################################################################################
+def fetch(name, pkg_dir, key):
+    """
+    Link (or copy, if PROJ.GENIP_STORE_LINK is not set) the library with the given key from the
+    GENIP_STORE into pkg_dir. Returns True if it was found.
+    """
+
+    entry = get_store_entry(name, key)
+    if entry is None or not os.path.isdir(entry):
+        return False
+
+    gvars.Log.debug("Fetching %s from %s" % (pkg_dir, entry))
+    remove_lib(pkg_dir)
+    if gvars.PROJ.GENIP_STORE_LINK:
+        os.symlink(entry, pkg_dir)
+    else:
+        tmp_name = get_tmp_name(pkg_dir)
+        shutil.copytree(entry, tmp_name, symlinks=True)
+        os.rename(tmp_name, pkg_dir)
+    return True
+
+########################################################################################
+def publish(name, pkg_dir, key):
+    """
+    Copy a freshly built library into the GENIP_STORE under its key. The copy is made under a
+    temporary name and then renamed into place, so others never see a partial library, and only
+    the first of several simultaneous publishers wins.
+    """
+
+    entry = get_store_entry(name, key)
+    if entry is None or os.path.exists(entry) or os.path.islink(pkg_dir):
+        return
+
+    tmp_name = get_tmp_name(entry)
+    try:
+        try:
+            os.makedirs(os.path.dirname(entry))
+        except OSError:
+            pass
+        shutil.copytree(pkg_dir, tmp_name, symlinks=True)
+        os.rename(tmp_name, entry)
+        gvars.Log.info("Published %s to %s" % (name, entry))
+    except (IOError, OSError, shutil.Error) as exc:
+        # most likely, another workspace published the same library first
+        gvars.Log.debug("Did not publish %s to %s: %s" % (name, entry, exc))
+        shutil.rmtree(tmp_name, ignore_errors=True)
+
+########################################################################################
+def get_tmp_name(path):
+    "Returns a hidden name alongside path that is unique to this process."
+
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, '.%s.%s.%d' % (basename, socket.gethostname(), os.getpid()))
+
+########################################################################################
+def prune(name):
+    "Remove the least-recently stashed libraries of a vkit beyond PROJ.GENIP_CACHE_SIZE."
+
+    cache_dir = get_cache_dir(name)
+    entries = [os.path.join(cache_dir, it) for it in os.listdir(cache_dir)]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for entry in entries[gvars.PROJ.GENIP_CACHE_SIZE:]:
+        gvars.Log.debug("Pruning %s" % entry)
+        try:
+            remove_lib(entry)
+        except OSError:
+            pass
@@ -0,0 +1,608 @@
+#!/usr/bin/env python2.7
+
+"""
+An optional server for one testbench directory, which runs each gogo there with its start-up
+already done.
+
+'gogo server' starts one in the background. It imports gogo, project.py, tb.py and every gadget,
+loads the vcfg.py of each vkit, and reads the directory index and file caches of .gogo. Then, for
+each gogo run in the directory, it forks a copy of itself. The copy takes on that gogo's
+command-line, directory, environment, umask, and stdin/stdout/stderr (through /proc), and runs
+gogo with all of that already in memory. The gogo itself only waits, passing on Ctrl-C, and exits
+with the copy's exit status.
+
+Every cache that the server keeps is checked against mtimes, as it would be in a fresh gogo, but
+project.py, tb.py and the vcfg.py files are not. So when one changes, the server starts over.
+inotify (through inotify_simple, if installed) notices that at once. inotify does not see changes
+made from other hosts over NFS, so their mtimes are also checked before each run; if any has
+changed, that gogo runs by itself while the server starts over. inotify also drops the index
+entries of watched directories as soon as they change.
+
+Each server is for one testbench directory, one --tb, and one environment (leaving out the
+variables that only differ between terminals, see get_env_digest), all of which name its socket.
+gogo runs by itself when no such server is running, when given --no-server, when GOGO_NO_SERVER
+is set, or when the server cannot take on its stdin/stdout/stderr (such as when they are sockets).
+The server exits after PROJ.SERVER_IDLE seconds without a request, or with 'gogo stop_server'.
+
+% gogo_server.py start|stop|status [--tb tb]
+"""
+
+from __future__ import print_function
+
+import errno
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# How long to wait for a request, or for a server to start, in seconds
+REQUEST_TIMEOUT = 10
+START_TIMEOUT = 60
+
+# The most directories of the index that are watched for changes
+MAX_WATCHES = 4096
+
+# The directory that gogo (and this file) are in
+GOGO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Environment variables that differ between terminals and shells without changing what gogo does,
+# and so are left out of get_env_digest, along with those that start with VOLATILE_PREFIXES
+VOLATILE_ENV = ('_', 'PWD', 'OLDPWD', 'SHLVL', 'TERM', 'COLUMNS', 'LINES', 'DISPLAY', 'GOGO_NO_SERVER')
+VOLATILE_PREFIXES = ('SSH_', 'XDG_', 'TMUX', 'STY', 'WINDOW', 'TERM_', 'KONSOLE_', 'VTE_', 'DBUS_')
+
+########################################################################################
+def get_env_digest(environ):
+    "Returns a digest of the environment, leaving out the variables that only differ between terminals."
+
+    import hashlib
+
+    items = sorted((key, val) for key, val in environ.items()
+                   if key not in VOLATILE_ENV and not key.startswith(VOLATILE_PREFIXES))
+    return hashlib.md5(json.dumps(items).encode('utf-8')).hexdigest()[:16]
+
+########################################################################################
+def get_tb(argv):
+    "Returns the --tb given in gogo's argv, or its default."
+
+    for idx, arg in enumerate(argv):
+        if arg == '--tb' and idx + 1 < len(argv):
+            return argv[idx + 1]
+        if arg.startswith('--tb='):
+            return arg[len('--tb='):]
+    return 'tb'
+
+########################################################################################
+def get_socket_name(tb='tb', environ=None):
+    """
+    Returns the name of the socket of the server for this testbench directory, for the tb and the
+    environment (by default, this one's).
+    """
+
+    import hashlib
+
+    key = '%s\0%s\0%s' % (os.path.realpath(os.getcwd()), tb, get_env_digest(environ or os.environ))
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+    tmp_dir = os.environ.get('TMPDIR', '/tmp')
+    return os.path.join(tmp_dir, 'gogo-%d-%s.sock' % (os.getuid(), digest))
+
+########################################################################################
+def send(sock, message):
+    "Send a message (anything that JSON can encode) as one line."
+
+    sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+########################################################################################
+def receive(rfile):
+    "Returns the next message from a file made from a socket, or None at the end."
+
+    line = rfile.readline()
+    if not line:
+        return None
+    return native(json.loads(line.decode('utf-8')))
+
+########################################################################################
+def native(value):
+    "Returns the value with its unicode strings made into str, as python 2 needs for os.environ."
+
+    if sys.version_info[0] > 2:
+        return value
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [native(it) for it in value]
+    if isinstance(value, dict):
+        return dict((native(key), native(val)) for key, val in value.items())
+    return value
+
+########################################################################################
+def request(message, name=None):
+    "Send a message to the server for this directory. Returns its reply, or None if there is none."
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(REQUEST_TIMEOUT)
+        sock.connect(name or get_socket_name())
+        send(sock, message)
+        return receive(sock.makefile('rb'))
+    except (socket.error, ValueError):
+        return None
+    finally:
+        sock.close()
+
+########################################################################################
+def run_client(argv):
+    """
+    Have the server for this directory, tb, and environment run gogo with argv, and wait for it.
+    Returns its exit status, or None if there is no server to run it (and so it must be run here).
+    """
+
+    name = get_socket_name(get_tb(argv))
+    if not os.path.exists(name):
+        return None
+
+    umask = os.umask(0)
+    os.umask(umask)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(name)
+        send(sock, {'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ), 'umask': umask})
+        rfile = sock.makefile('rb')
+        reply = receive(rfile)
+    except (socket.error, ValueError):
+        sock.close()
+        return None
+    if not reply or 'pid' not in reply:
+        sock.close()
+        return None
+
+    # gogo's own handling of Ctrl-C (and the like) happens in the server's copy
+    def forward(signum, frame):
+        try:
+            os.kill(reply['pid'], signum)
+        except OSError:
+            pass
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, forward)
+        signal.siginterrupt(signum, False)
+
+    try:
+        result = receive(rfile)
+    except (socket.error, ValueError):
+        result = None
+    sock.close()
+    if not result or 'status' not in result:
+        return 1
+    return result['status']
+
+########################################################################################
+def reap_children(*args):
+    "Reap any children that have exited. Used as the server's SIGCHLD handler."
+
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0]:
+            pass
+    except OSError:
+        pass
+
+########################################################################################
+class Server(object):
+    """
+    Listens on the socket for one testbench directory, and forks a copy of itself to run each
+    gogo that is sent to it.
+    """
+
+    #--------------------------------------------
+    def __init__(self, name, tb='tb'):
+        self.name = name
+        self.tb = tb
+
+        # the environment that the server started with (before any module was loaded), which
+        # each gogo that it runs must have too
+        self.environ = dict(os.environ)
+        self.env_digest = get_env_digest(self.environ)
+
+        # the modules and caches that each copy starts with
+        self.gogo = None
+        self.log = None
+
+        # the mtime of each configuration file, keyed on file name
+        self.config_files = {}
+
+        self.listener = None
+
+        # the inotify instance, and the directory of each of its watches
+        self.inotify = None
+        self.watches = {}
+
+        # set when a configuration file changes
+        self.stale = False
+
+        self.last_request = time.time()
+
+    #--------------------------------------------
+    def run(self):
+        "Warm up, then serve until idle or stopped."
+
+        self.warm_up()
+        self.listen()
+        self.watch()
+        signal.signal(signal.SIGCHLD, reap_children)
+        signal.siginterrupt(signal.SIGCHLD, False)
+        self.log.info("gogo server for %s is listening on %s" % (os.getcwd(), self.name))
+        self.serve()
+
+    #--------------------------------------------
+    def warm_up(self):
+        "Do all that gogo does before reading its command-line, along with the slowest of what follows."
+
+        import argparse
+        import cn_logging
+        import logging
+
+        import gvars
+        gvars.Log = self.log = cn_logging.getLogger('gogo.log')
+        gvars.Log.setLevel(logging.INFO)
+        gvars.Options = argparse.Namespace(tb=self.tb, dbg=False, noflush=False,
+                                           profile_startup=False, no_server=False, only_vkits=None)
+        gvars.CommandLineVariables = []
+
+        modules_before = set(sys.modules)
+        gvars.setup_globals()
+
+        handler = logging.FileHandler(os.path.join(gvars.GogoDir, 'server.log'))
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        self.log.addHandler(handler)
+
+        # project.py, tb.py, and anything that they imported from the project
+        for mod_name in set(sys.modules) - modules_before:
+            fname = getattr(sys.modules[mod_name], '__file__', None) or ''
+            if fname.startswith((gvars.RootDir, os.getcwd())) and not fname.startswith(GOGO_DIR):
+                self.add_config_file(os.path.splitext(fname)[0] + '.py')
+
+        # gogo itself (which has no .py, so it cannot just be imported), and what it would import
+        import imp
+        self.gogo = imp.new_module('gogo_main')
+        self.gogo.__file__ = os.path.join(GOGO_DIR, 'gogo')
+        with open(self.gogo.__file__) as gfile:
+            exec(compile(gfile.read(), self.gogo.__file__, 'exec'), self.gogo.__dict__)
+
+        import completion, executor, flists, gadget, genip_cache, module_env, pymake, schedule
+        import simlogs, telemetry, utils
+        for fname in sorted(os.listdir(os.path.join(GOGO_DIR, 'gadgets'))):
+            if fname.endswith('.py') and fname != '__init__.py':
+                __import__('gadgets.' + fname[:-3])
+        try:
+            import cmdline
+        except ImportError:
+            pass
+
+        pymake.load_index()
+        flists.load_cache()
+        flists.load_includes()
+        genip_cache.load_file_hashes()
+        module_env.load_cache()
+
+        from gadgets.vkit import VkitGadget
+        for entry in gvars.TB.VKITS:
+            if isinstance(entry, str) and entry.endswith('.py') and os.path.exists(entry):
+                VkitGadget.load_vcfg(entry)
+                self.add_config_file(os.path.abspath(entry))
+
+    #--------------------------------------------
+    def add_config_file(self, fname):
+        try:
+            self.config_files[fname] = os.path.getmtime(fname)
+        except OSError:
+            pass
+
+    #--------------------------------------------
+    def listen(self):
+        "Listen on the socket, which only this user may use."
+
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            if os.path.exists(self.name):
+                os.unlink(self.name)
+            self.listener.bind(self.name)
+        finally:
+            os.umask(umask)
+        self.listener.listen(16)
+
+    #--------------------------------------------
+    def watch(self):
+        "Watch the directories of the configuration files, and of the index, with inotify."
+
+        import pymake
+
+        if inotify_simple is None:
+            return
+
+        flags = inotify_simple.flags
+        masks = {}
+        for dirname in sorted(pymake.load_index())[:MAX_WATCHES]:
+            masks[dirname] = flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO
+        for fname in self.config_files:
+            dirname = os.path.dirname(fname)
+            masks[dirname] = masks.get(dirname, 0) | flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE
+
+        try:
+            self.inotify = inotify_simple.INotify()
+        except OSError:
+            return
+        for dirname, mask in masks.items():
+            try:
+                self.watches[self.inotify.add_watch(dirname, mask)] = dirname
+            except OSError:
+                # such as when out of watches, which only costs a little speed
+                pass
+
+    #--------------------------------------------
+    def read_events(self):
+        "Drop the index entries of directories that changed. Note if any configuration file did."
+
+        import pymake
+
+        index = pymake.load_index()
+        for event in self.inotify.read(timeout=0):
+            dirname = self.watches.get(event.wd)
+            if dirname is None:
+                continue
+            index.pop(dirname, None)
+            if os.path.join(dirname, event.name) in self.config_files:
+                self.log.info("%s changed" % os.path.join(dirname, event.name))
+                self.stale = True
+
+    #--------------------------------------------
+    def is_stale(self):
+        "Returns True if any configuration file has changed since the server started."
+
+        if not self.stale:
+            for fname, mtime in self.config_files.items():
+                try:
+                    if os.path.getmtime(fname) != mtime:
+                        self.stale = True
+                except OSError:
+                    self.stale = True
+        return self.stale
+
+    #--------------------------------------------
+    def serve(self):
+        "Answer requests until idle for PROJ.SERVER_IDLE seconds, or until stopped."
+
+        import gvars
+        import select
+
+        idle = gvars.PROJ.SERVER_IDLE
+        while True:
+            fds = [self.listener]
+            if self.inotify is not None:
+                fds.append(self.inotify.fileno())
+            try:
+                ready, _, _ = select.select(fds, [], [], 60)
+            except (select.error, OSError) as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if self.inotify is not None and self.inotify.fileno() in ready:
+                self.read_events()
+            if self.stale:
+                self.restart()
+            if self.listener in ready:
+                self.accept()
+            if idle and time.time() - self.last_request > idle:
+                self.log.info("Exiting after %d seconds without a request" % idle)
+                self.close()
+                return
+
+    #--------------------------------------------
+    def accept(self):
+        "Answer one request."
+
+        try:
+            conn, _ = self.listener.accept()
+        except socket.error:
+            return
+
+        try:
+            conn.settimeout(REQUEST_TIMEOUT)
+            peer_pid, peer_uid, _ = struct.unpack('3i', conn.getsockopt(
+                socket.SOL_SOCKET, getattr(socket, 'SO_PEERCRED', 17), struct.calcsize('3i')))
+            message = receive(conn.makefile('rb'))
+        except (socket.error, ValueError):
+            conn.close()
+            return
+        if peer_uid != os.getuid() or not message:
+            conn.close()
+            return
+
+        self.last_request = time.time()
+        if message.get('ping'):
+            send(conn, {'pid': os.getpid(), 'dir': os.getcwd()})
+        elif message.get('stop'):
+            send(conn, {'stopped': True})
+            conn.close()
+            self.log.info("Stopped")
+            self.close()
+            sys.exit(0)
+        elif get_tb(message['argv']) != self.tb or get_env_digest(message['env']) != self.env_digest:
+            # the socket is named for both, so this gogo has found another's server
+            send(conn, {'error': 'for another tb or environment'})
+        elif self.is_stale():
+            # this one runs by itself, while the server starts over
+            send(conn, {'error': 'restarting'})
+            conn.close()
+            self.restart()
+        else:
+            pid = os.fork()
+            if pid == 0:
+                self.run_child(conn, peer_pid, message)
+            self.log.info("%d runs: %s" % (pid, ' '.join(message['argv'][1:])))
+        conn.close()
+
+    #--------------------------------------------
+    def run_child(self, conn, peer_pid, message):
+        "In the forked copy, take on the gogo's terminal and run it. Never returns."
+
+        status = 1
+        try:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            self.listener.close()
+            if self.inotify is not None:
+                self.inotify.close()
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+            try:
+                for fdesc, flags in ((0, os.O_RDONLY), (1, os.O_WRONLY | os.O_APPEND), (2, os.O_WRONLY | os.O_APPEND)):
+                    new_fdesc = os.open('/proc/%d/fd/%d' % (peer_pid, fdesc), flags)
+                    os.dup2(new_fdesc, fdesc)
+                    os.close(new_fdesc)
+                os.chdir(message['cwd'])
+            except OSError as exc:
+                send(conn, {'error': str(exc)})
+                os._exit(1)
+
+            os.environ.clear()
+            os.environ.update(message['env'])
+            import module_env
+            module_env.reset()
+            os.umask(message['umask'])
+            sys.argv = message['argv']
+
+            send(conn, {'pid': os.getpid()})
+            status = self.run_gogo()
+            send(conn, {'status': status})
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    #--------------------------------------------
+    def run_gogo(self):
+        "Run gogo's main, as a fresh gogo would. Returns its exit status."
+
+        import logging
+        import startup
+
+        startup.Start = time.time()
+        del startup.Steps[:]
+        startup.Profiling = '--profile-startup' in sys.argv
+
+        # gogo adds its own handler
+        log = logging.getLogger('gogo.log')
+        for handler in list(log.handlers):
+            log.removeHandler(handler)
+
+        status = 0
+        try:
+            self.gogo.main()
+        except SystemExit as exc:
+            if exc.code is None or isinstance(exc.code, int):
+                status = exc.code or 0
+            else:
+                print(exc.code, file=sys.stderr)
+                status = 1
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            status = 1
+
+        startup.print_profile()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        return status
+
+    #--------------------------------------------
+    def close(self):
+        "Stop listening."
+
+        self.listener.close()
+        try:
+            os.unlink(self.name)
+        except OSError:
+            pass
+
+    #--------------------------------------------
+    def restart(self):
+        "Start over, as a new process, so that all of the configuration is read again."
+
+        self.log.info("Starting over")
+        self.close()
+        os.execve(sys.executable, [sys.executable, os.path.join(GOGO_DIR, 'gogo_server.py'), 'serve', '--tb', self.tb],
+                  self.environ)
+
+########################################################################################
+def start(tb='tb'):
+    """
+    Start a server for this directory, tb, and environment in the background, unless one is
+    running. Returns True once it is listening.
+    """
+
+    name = get_socket_name(tb)
+    if request({'ping': True}, name):
+        return True
+
+    pid = os.fork()
+    if pid == 0:
+        # detach from this terminal and session
+        os.setsid()
+        if os.fork():
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fdesc in (0, 1, 2):
+            os.dup2(devnull, fdesc)
+        try:
+            Server(name, tb).run()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    stop_time = time.time() + START_TIMEOUT
+    while time.time() < stop_time:
+        if request({'ping': True}, name):
+            return True
+        time.sleep(0.1)
+    return False
+
+########################################################################################
+def stop(tb='tb', environ=None):
+    "Stop the server for this directory, tb, and environment. Returns False if none was running."
+
+    return request({'stop': True}, get_socket_name(tb, environ)) is not None
+
+########################################################################################
+if __name__ == '__main__':
+    import argparse
+
+    p = argparse.ArgumentParser(description="Starts, stops, or runs a gogo server for this directory.")
+    p.add_argument('command', choices=['start', 'stop', 'status', 'serve'])
+    p.add_argument('--tb', default='tb', help="The tb.py configuration file.")
+    args = p.parse_args()
+
+    if args.command == 'start':
+        if not start(args.tb):
+            print("The gogo server did not start. See .gogo/server.log")
+            sys.exit(1)
+    elif args.command == 'stop':
+        if not stop(args.tb):
+            print("No gogo server is running for %s" % os.getcwd())
+    elif args.command == 'status':
+        reply = request({'ping': True}, get_socket_name(args.tb))
+        if reply:
+            print("gogo server %d is running for %s" % (reply['pid'], reply['dir']))
+        else:
+            print("No gogo server is running for %s" % os.getcwd())
+            sys.exit(1)
+    else:
+        Server(get_socket_name(args.tb), args.tb).run()
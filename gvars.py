@@ -5,8 +5,7 @@ Contains all of the global variables.
 import sys
 import var_type
 import os
-import gadget
-from area_utils import calcRootDir
+from var_type import Deferred
 
 # Keys is the guideline by how Vars will be created. Each key is the variable name and has the default value, the type, and a comment on its purpose.
 # Vars is a dictionary of values, to be filled in with values by setup-files like project.py and tb.py.
@@ -45,7 +44,10 @@ VTYPES = {
         'DIR'            : ['', (str,),       "Specify alternate directory for results."],
         'TOPO'           : [0, (int,),        "Print UVM topology at this depth."],
         'SVFCOV'         : [0, (int,bool),    "Run with SV Functional Coverage"],
-        'WAVE'           : [None, (str,),     "Dump waves to 'fsdb' or 'vpd' file."]
+        'WAVE'           : [None, (str,),     "Dump waves to 'fsdb' or 'vpd' file."],
+        'TESTLIST'       : ["tests/*.sv", (str,), "Regression: a glob over the test files, or a file that names one test per line"],
+        'SEEDS'          : [1, (int,),        "Regression: the number of seeds to run each test with"],
+        'MAX_SIMS'       : [0, (int,),        "Regression: the most simulations to run at once (0 for no limit)"],
     },
 
     # Testbench Options
@@ -58,6 +60,7 @@ VTYPES = {
         'INCDIRS'        : [[], (list,),      "The list of +incdirs to create for this testbench"],
         'LIBRARIES'      : [[], (list,),      "The list of library directories to create for this testbench"],
         'CSR_FILES'      : [[], (list,),      "The list of .csr files required for this testbench"],
+        'WATCH_TEST'     : ["", (str,),       "A test that 'gogo watch' simulates after each rebuild (none if empty)"],
     },
 
     # Miscellaneous Project settings
@@ -69,6 +72,20 @@ VTYPES = {
         'CLEAN_FILES'      : [[], (list,),      "Names of files to delete"],
         'UVM_REV'          : ["1_1d", (str,),   "UVM Revision to use"],
         'VKITS_DIR'        : ["", (str,),       "The location of all vkit directories"],
+        'GENIP_CACHE_SIZE' : [4, (int,),        "The number of previously built libraries kept per vkit in the genip cache (0 to disable)"],
+        'GENIP_STORE'      : ["", (str,),       "A directory shared by all workspaces, where built genip libraries are published and fetched"],
+        'GENIP_STORE_LINK' : [1, (int,bool),    "Symlink (1) or copy (0) libraries fetched from the GENIP_STORE"],
+        'STAT_THREADS'     : [16, (int,),       "The number of threads used to check file modification times (0 for serial)"],
+        'VKIT_DEPS'        : ["warn", (str,),   "Check each vkit's DEPENDENCIES against the packages its sources reference: 'off', 'warn', 'error', or 'fill' to add those that are missing"],
+        'REPORT_RUNS'      : [5, (int,),        "The number of the latest runs that 'gogo report' summarizes"],
+        'EXECUTOR'         : ["sge", (str,),    "Where gadgets' jobs run: 'sge', or 'local' to run them on this machine"],
+        'LOCAL_GADGETS'    : [[], (list,),      "Names of gadgets that always run on this machine, whatever the PROJ.EXECUTOR"],
+        'LOCAL_CORES'      : [0, (int,),        "The number of cores that jobs run on this machine may use at once (0 for all of them)"],
+        'MODULE_ENV'       : [0, (int,bool),    "Set the cached environment of gadgets' modules in their scripts (1), rather than running each command with runmod (0)"],
+        'SERVER_IDLE'      : [3600, (int,),     "Seconds without a request after which a gogo server exits (0 to never)"],
+        'WATCH_DEBOUNCE'   : [0.5, (float,int), "Seconds that 'gogo watch' waits for changes to stop before it rebuilds"],
+        'PREPARE_THREADS'  : [8, (int,),        "The number of threads that get lightweight gadgets ready at once (0 for serial)"],
+        'COALESCE_GADGETS' : [[], (list,),      "Names (or glob patterns) of gadgets whose jobs may share one SGE job with others of the same phase"],
     }
 }
 
@@ -164,8 +181,14 @@ def setup_globals():
     global RootDir
     global GogoDir
 
+    # these are only imported once they are needed, so that gogo starts quickly
+    import gadget
+    import sge_tools
+    from area_utils import calcRootDir
+
     var_type.Log = Log
     gadget.Log = Log
+    sge_tools.Log = Log
     RootDir = calcRootDir()
 
     # create a symbolic link called 'project' to the Root directory, if one does not ealready exist
@@ -177,6 +200,10 @@ def setup_globals():
     # set the name of the gogo directory where all turd files are kept
     GogoDir = os.path.join(RootDir, '.gogo')
 
+    # keep the index of source directories in the gogo directory
+    import pymake
+    pymake.IndexFilename = os.path.join(GogoDir, 'dir_index.pkl')
+
     # The names of all the library files that will be imported
     libraries = ['project', Options.tb]
 
@@ -204,6 +231,8 @@ def setup_globals():
     # check that all global variables are ok
     check_vars()
 
+    pymake.StatThreads = PROJ.STAT_THREADS
+
 ########################################################################################
 def check_vars():
     if VLOG.COMPTYPE.lower() in ('p', 'part', 'partition'):
@@ -215,6 +244,12 @@ def check_vars():
     else:
         Log.critical("VLOG.COMPTYPE value of %s is not recognized." % VLOG.COMPTYPE)
 
+    if PROJ.VKIT_DEPS not in ('off', 'warn', 'error', 'fill'):
+        Log.critical("PROJ.VKIT_DEPS value of %s is not recognized." % PROJ.VKIT_DEPS)
+
+    if PROJ.EXECUTOR not in ('sge', 'local'):
+        Log.critical("PROJ.EXECUTOR value of %s is not recognized." % PROJ.EXECUTOR)
+
     # These options are not yet available
     if SIM.GUI == 'verdi':
         Log.critical("SIM.GUI=verdi is not yet supported")
@@ -262,13 +297,16 @@ def get_vkits(vkit_names, get_all=False):
 ########################################################################################
 def get_env_variable(var, module=None):
     """
-    Returns the value of an environment variable. If given the name of a module, loads that module first.
+    Returns the value of an environment variable. If given the name of a module, loads that module
+    first, from the cache of module environments if it can be (see module_env.py).
     """
 
     if module:
-        cn_common_dir = os.environ['CN_COMMON_DIR']
-        cmd = os.popen('tclsh %s/cad/modulecmd/current/modulecmd.tcl python load %s' % (cn_common_dir, module))
-        exec(cmd)
+        import module_env
+        if not module_env.load_module(module):
+            cn_common_dir = os.environ['CN_COMMON_DIR']
+            cmd = os.popen('tclsh %s/cad/modulecmd/current/modulecmd.tcl python load %s' % (cn_common_dir, module))
+            exec(cmd)
 
     try:
         Log.debug("Returning for %s: %s" % (var, os.environ[var]))
@@ -276,3 +314,12 @@ def get_env_variable(var, module=None):
     except KeyError:
         Log.critical("Unable to load variable %s with module %s" % (var, module))
 
+########################################################################################
+def defer_env_variable(var, module=None):
+    """
+    As get_env_variable, but the module is only loaded once the value is first used. Returns a
+    Deferred (see var_type.py), which may be assigned to variables or added to strings.
+    """
+
+    return Deferred(get_env_variable, var, module)
+
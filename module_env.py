@@ -0,0 +1,330 @@
+#!/usr/bin/env python2.7
+
+"""
+Caches the changes that loading each module makes to the environment.
+
+Loading a module means running modulecmd.tcl in tclsh, which is slow, and runmod does it again
+for every command of every gadget. Instead, the change that a module makes (its delta) is kept in
+.gogo/module_env.json, keyed on the module and on the modules already loaded (LOADEDMODULES, which
+a module's prerequisites change), and is used again for as long as modulecmd.tcl has the same
+name and mtime. With PROJ.MODULE_ENV set, gadgets' scripts then set the environment of their
+modules once, at the top (see get_setenv_lines), or run each command with it (see get_env_prefix).
+
+A delta maps each variable that the module changes to one of:
+  ['set', value]           the module set it to value
+  ['prepend', text]        the module put text in front of its value (as with PATH)
+  ['append', text]         the module put text after its value
+  ['wrap', [front, back]]  the module did both, with front and back
+  ['unset', None]          the module removed it
+so that it may be applied to an environment other than the one in which it was found. A list
+variable (see is_list_var) that was not set where the delta was found is taken to have been
+prepended to, so that its value elsewhere (such as a user's own LD_LIBRARY_PATH) is kept.
+
+Deltas are found, and environments are built, from Pristine: the environment that gogo started
+with. The environment of gogo's own process is never changed except by load_module, so that
+gadgets may be readied in threads, and a module loaded by gogo is not applied twice to the
+environment of a command that also loads it.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import threading
+import types
+
+# The delta of each module, keyed on get_cache_key. Each is a dict of modulecmd, mtime, and delta.
+# The 'format' entry is CACHE_FORMAT, which changes whenever the deltas would.
+Cache = None
+CACHE_FORMAT = 2
+CacheFilename = None
+
+# The variables, other than those whose names end in PATH, whose values are lists separated by :
+LIST_VARS = set(['LOADEDMODULES', '_LMFILES_'])
+
+# The result of get_changes, keyed on the tuples of the modules loaded and of those given, so
+# that each set of modules is only resolved once per run
+Changes = {}
+
+# The environment before any module was loaded into this process, and the modules that
+# load_module has loaded since, in order
+Pristine = dict(os.environ)
+Loaded = []
+
+# Held while the Cache, Changes, or Loaded are being read or changed
+Lock = threading.RLock()
+
+########################################################################################
+def get_modulecmd():
+    "Returns the name of modulecmd.tcl, or None if it is not known."
+
+    try:
+        return os.path.join(os.environ['CN_COMMON_DIR'], 'cad/modulecmd/current/modulecmd.tcl')
+    except KeyError:
+        return None
+
+########################################################################################
+def load_cache():
+    "Returns the Cache, reading it from .gogo the first time."
+
+    global Cache, CacheFilename
+
+    if Cache is None:
+        if CacheFilename is None:
+            import gvars
+            CacheFilename = os.path.join(gvars.GogoDir, 'module_env.json')
+        try:
+            with open(CacheFilename) as cfile:
+                Cache = json.load(cfile)
+        except (IOError, ValueError):
+            Cache = {}
+        if Cache.get('format') != CACHE_FORMAT:
+            Cache = {'format': CACHE_FORMAT}
+    return Cache
+
+########################################################################################
+def get_cache_key(module):
+    "Returns the key of the module's delta in the Cache."
+
+    loaded = Pristine.get('LOADEDMODULES')
+    return "%s %s" % (module, loaded) if loaded else module
+
+########################################################################################
+def is_list_var(var):
+    "Returns True if the value of the variable is a list separated by :, as PATH is."
+
+    return var.endswith('PATH') or var in LIST_VARS
+
+########################################################################################
+def save_cache():
+    "Write the Cache back to .gogo."
+
+    tmp_name = "%s.%d" % (CacheFilename, os.getpid())
+    try:
+        with open(tmp_name, 'w') as cfile:
+            json.dump(Cache, cfile, indent=1, sort_keys=True)
+        os.rename(tmp_name, CacheFilename)
+    except (IOError, OSError):
+        pass
+
+########################################################################################
+def find_delta(modulecmd, module):
+    """
+    Returns the delta of loading the module into the Pristine environment, found by running
+    modulecmd and then its python output, which changes a copy of that environment rather than
+    os.environ. Returns None if modulecmd failed.
+    """
+
+    before = dict(Pristine)
+    try:
+        proc = subprocess.Popen(['tclsh', modulecmd, 'python', 'load', module], env=before,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        code, _ = proc.communicate()
+    except OSError:
+        return None
+    if proc.returncode or not code.strip():
+        return None
+
+    # the output only uses os.environ, so it is given an os module of its own
+    fake_os = types.ModuleType('os')
+    fake_os.__dict__.update(os.__dict__)
+    fake_os.environ = dict(before)
+    try:
+        exec(code, {'os': fake_os})
+    except Exception:
+        return None
+    after = fake_os.environ
+
+    delta = {}
+    for var in set(before) | set(after):
+        old, new = before.get(var), after.get(var)
+        if old == new:
+            continue
+        middle = ':%s:' % old
+        if new is None:
+            delta[var] = ['unset', None]
+        elif old and new.endswith(old):
+            delta[var] = ['prepend', new[:-len(old)]]
+        elif old and new.startswith(old):
+            delta[var] = ['append', new[len(old):]]
+        elif not is_list_var(var):
+            delta[var] = ['set', new]
+        elif not old:
+            delta[var] = ['prepend', new + ':']
+        elif middle in new:
+            idx = new.index(middle)
+            delta[var] = ['wrap', [new[:idx + 1], new[idx + len(middle) - 1:]]]
+        else:
+            delta[var] = ['set', new]
+    return delta
+
+########################################################################################
+def get_delta(module):
+    """
+    Returns the delta of loading the module (see above), from the Cache if modulecmd is unchanged.
+    Returns None if it could not be found.
+    """
+
+    with Lock:
+        return get_delta_locked(module)
+
+########################################################################################
+def get_delta_locked(module):
+    "As get_delta, with the Lock held."
+
+    modulecmd = get_modulecmd()
+    if modulecmd is None:
+        return None
+    try:
+        mtime = os.path.getmtime(modulecmd)
+    except OSError:
+        return None
+
+    cache = load_cache()
+    key = get_cache_key(module)
+    entry = cache.get(key)
+    if entry is not None and entry['modulecmd'] == modulecmd and entry['mtime'] == mtime:
+        return entry['delta']
+
+    delta = find_delta(modulecmd, module)
+    if delta is None:
+        return None
+
+    # loading a module that is already loaded changes nothing, which is not worth keeping
+    if module not in Pristine.get('LOADEDMODULES', '').split(':'):
+        cache[key] = {'modulecmd': modulecmd, 'mtime': mtime, 'delta': delta}
+        save_cache()
+    return delta
+
+########################################################################################
+def apply_delta(delta, environ):
+    "Make the changes of the delta to environ (a dict, or os.environ)."
+
+    for var, (how, text) in delta.items():
+        old = environ.get(var)
+        if how == 'wrap':
+            front, back = text
+        else:
+            front, back = (text, '') if how == 'prepend' else ('', text)
+
+        if how == 'unset':
+            environ.pop(var, None)
+        elif how == 'set':
+            environ[var] = text
+        elif old:
+            environ[var] = front + old + back
+        else:
+            # an empty entry in a list such as PATH would mean the current directory
+            environ[var] = ':'.join([it for it in (front + back).split(':') if it])
+
+########################################################################################
+def reset():
+    "Take the environment of this process, as it is now, to be Pristine (as a gogo server does)."
+
+    with Lock:
+        Pristine.clear()
+        Pristine.update(os.environ)
+        del Loaded[:]
+        Changes.clear()
+
+########################################################################################
+def load_module(module):
+    "Load the module into this process's environment. Returns False if it could not be."
+
+    with Lock:
+        if module in Loaded:
+            return True
+        delta = get_delta(module)
+        if delta is None:
+            return False
+        apply_delta(delta, os.environ)
+        Loaded.append(module)
+        return True
+
+########################################################################################
+def get_environment(modules):
+    """
+    Returns the environment (a dict) that commands would have with the modules loaded, as well as
+    those loaded into this process, or None if any of them could not be. Each module is applied to
+    the Pristine environment once.
+    """
+
+    with Lock:
+        modules = Loaded + [it for it in modules if it not in Loaded]
+    environ = dict(Pristine)
+    for module in modules:
+        delta = get_delta(module)
+        if delta is None:
+            return None
+        apply_delta(delta, environ)
+    return environ
+
+########################################################################################
+def csh_quote(text):
+    "Returns the text quoted for csh, which expands ! even within single quotes."
+
+    return "'%s'" % text.replace("'", "'\\''").replace('!', '\\!')
+
+########################################################################################
+def get_changes(modules):
+    """
+    Returns how the Pristine environment must change for commands to have the modules loaded, as
+    ([variables to unset], [(variable, value)...]), or None if any module could not be. The values
+    are whole, so they may be applied to the environment of this process, which differs from
+    Pristine only by the modules that it has loaded.
+    """
+
+    with Lock:
+        key = (tuple(Loaded), tuple(modules))
+        if key not in Changes:
+            environ = get_environment(modules)
+            if environ is None:
+                Changes[key] = None
+            else:
+                unset = sorted(set(Pristine) - set(environ))
+                assign = [(it, environ[it]) for it in sorted(environ) if environ[it] != Pristine.get(it)]
+                Changes[key] = (unset, assign)
+        return Changes[key]
+
+########################################################################################
+def get_env_prefix(modules):
+    """
+    Returns the prefix that runs a command with the modules loaded, as runmod would, but without
+    running modulecmd: 'env -u VAR VAR=value ... ', or '' if they change nothing. Returns None if
+    any module could not be loaded.
+    """
+
+    changes = get_changes(modules)
+    if changes is None:
+        return None
+
+    unset, assign = changes
+    words = ['-u %s' % it for it in unset] + ['%s=%s' % (var, csh_quote(value)) for var, value in assign]
+    return 'env %s ' % ' '.join(words) if words else ''
+
+########################################################################################
+def get_setenv_lines(modules):
+    """
+    Returns the lines of csh that load the modules into the environment of a script, with
+    unsetenv and setenv, so that the commands after them need no runmod. Returns None if any
+    module could not be loaded.
+    """
+
+    changes = get_changes(modules)
+    if changes is None:
+        return None
+
+    unset, assign = changes
+    result = ['# the environment of modules %s' % ' '.join(modules)]
+    result.extend(['unsetenv %s' % it for it in unset])
+    result.extend(['setenv %s %s' % (var, csh_quote(value)) for var, value in assign])
+    return result
+
+########################################################################################
+if __name__ == '__main__':
+    import sys
+
+    CacheFilename = os.path.join('.gogo', 'module_env.json')
+    for module in sys.argv[1:]:
+        print("%s: %s" % (module, json.dumps(get_delta(module), indent=1, sort_keys=True)))
@@ -29,7 +29,8 @@ PROJ.MODULES['verdi'] = 'synopsys-vc-verdi/%s' % VC_VERSION
 PROJ.MODULES['synopsys-designware'] = 'synopsys-designware/20140815'
 
 # Miscellaneous
-VERDI_HOME = get_env_variable('VERDI_HOME', PROJ.MODULES['verdi'])
+# (the verdi module is only loaded if these are used, as by vlog, not every time gogo starts)
+VERDI_HOME = defer_env_variable('VERDI_HOME', PROJ.MODULES['verdi'])
 
 #--------------------------------------------
 # Verilog Variables
@@ -40,7 +41,7 @@ VLOG.VCOMP_DIR  = 'sim/.vcomp'
 # .tab files
 VLOG.TAB_FILES = ['project/verif/uvm_common/explicit/vpi_msg.tab',
                  'project/verif/uvm_common/explicit/cn_rand.tab',
-                 '%s/share/PLI/VCS/LINUX64/novas.tab' % (VERDI_HOME),
+                 VERDI_HOME + '/share/PLI/VCS/LINUX64/novas.tab',
                  'project/verif/common/explicit/cn_bist_mon.tab',
                  'project/verif/uvm_common/explicit/fake_vcsTBV.tab',
                  ]
@@ -55,7 +56,7 @@ VLOG.SO_FILES = ['obj/VCS/vpi_msg.so',
                 ]
 
 # .a files
-VLOG.ARC_LIBS = ['%s/share/PLI/VCS/LINUX64/pli.a' % (VERDI_HOME), ]
+VLOG.ARC_LIBS = [VERDI_HOME + '/share/PLI/VCS/LINUX64/pli.a', ]
 
 # VCS/VLOGAN Options
 VLOG.OPTIONS = ' -notice -unit_timescale=1ns/1fs -ntb_opts uvm -sverilog -full64 %s/uvm/%s/src/dpi/uvm_dpi.cc -bc=cb_extended_behavior' % (PROJ.VKITS_DIR, PROJ.UVM_REV)
@@ -7,7 +7,12 @@ targets should be remade based on modification times of all files.
 Will raise NonExistantFile if any sources are missing.
 
 Includes the glob_files function which helps to aggregate files based
-on known include directories and glob patterns.
+on known include directories and glob patterns, and the find_files function
+which does the same for file suffixes in a single pass, returning the stat
+of each file found.
+
+Run with --bench to compare the two on a synthetic tree:
+% pymake.py --bench [number of files]
 
 This probably should just be replaced with something like scons or waf.
 
@@ -18,12 +23,49 @@ __version__ = '0.0.1'
 __author__  = 'Brian Hunter'
 __email__   = 'brian.hunter@cavium.com'
 
+########################################################################################
+# Imports
+
+# scandir is only in os as of python 3.5, otherwise use the backport (if installed)
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 ########################################################################################
 # Globals
 
 # A cache of modified filenames and their respective mtimes
 Mtimes = {}
 
+# A persistent index of directory listings, keyed on absolute directory name. Each value is
+# [mtime, files, subdirs]. A directory whose mtime has not changed has had nothing added,
+# removed, or renamed, so its listing can be reused instead of read again.
+DirIndex = None
+
+# Where DirIndex is saved between runs (if None, it is only kept in memory)
+IndexFilename = None
+
+# Set when DirIndex must be written back to IndexFilename
+IndexChanged = False
+
+# Directories modified more recently than this (in seconds) are not indexed, since a file
+# could still be added within the same mtime tick without changing it
+INDEX_MIN_AGE = 2
+
+# The number of threads used to stat files in calc_mtimes. On a network filesystem each stat is
+# a round trip, so many may be in flight at once. 0 or 1 stats them serially.
+StatThreads = 0
+
+# Fewer files than this are always stat'ed serially
+PARALLEL_STAT_MIN = 32
+
+# The thread pool, created the first time it is needed
+StatPool = None
+
 ########################################################################################
 # Exceptions
 
@@ -66,30 +108,67 @@ def get_extreme_mtime(files, old, get_file=False):
 
     cause = None
     if get_file:
-        for key in Mtimes:
-            if Mtimes[key] == result:
-                cause = key
-                break
+        cause = files[mtimes.index(result)]
     return (result, cause)
 
 ########################################################################################
 def calc_mtimes(filenames):
+    """
+    Returns the mtimes of all of the files, using (and filling in) the Mtimes cache.
+    Files not yet in the cache are stat'ed in parallel when StatThreads allows.
+    Raises NonExistantFile with the name of the first file that does not exist.
+    """
+
     import os
     global Mtimes
 
-    mtimes = []
+    filenames = [os.path.abspath(it) for it in filenames]
+    uncached = [it for it in filenames if it not in Mtimes]
+    if uncached:
+        Mtimes.update(stat_mtimes(uncached))
+
     try:
-        for fname in filenames:
-            fname = os.path.abspath(fname)
-            try:
-                mtimes.append(Mtimes[fname])
-            except KeyError:
-                an_mtime = Mtimes[fname] = os.stat(fname).st_mtime
-                mtimes.append(an_mtime)
-    except:
-        raise NonExistantFile(fname)
+        return [Mtimes[fname] for fname in filenames]
+    except KeyError as exc:
+        raise NonExistantFile(exc.args[0])
 
-    return mtimes
+########################################################################################
+def get_mtime(fname):
+    "Returns (fname, mtime), or (fname, None) if fname does not exist."
+
+    import os
+
+    try:
+        return (fname, os.stat(fname).st_mtime)
+    except OSError:
+        return (fname, None)
+
+########################################################################################
+def stat_mtimes(filenames):
+    """
+    Returns a dictionary of the mtimes of those files that exist, stat'ing them with a pool of
+    StatThreads threads. Falls back to stat'ing serially if the pool cannot be used.
+    """
+
+    global StatPool
+
+    results = None
+    if StatThreads > 1 and len(filenames) >= PARALLEL_STAT_MIN:
+        try:
+            if StatPool is None:
+                from multiprocessing.pool import ThreadPool
+                StatPool = ThreadPool(StatThreads)
+            chunksize = max(1, len(filenames) // (StatThreads * 4))
+            results = StatPool.map(get_mtime, filenames, chunksize)
+        except Exception:
+            # such as when no more threads may be started
+            StatPool = None
+            results = None
+
+    if results is None:
+        results = [get_mtime(it) for it in filenames]
+
+    return dict([it for it in results if it[1] is not None])
 
 ########################################################################################
 def pymake(targets, sources, get_cause=False):
@@ -125,6 +204,126 @@ def pymake(targets, sources, get_cause=False):
     else:
         return Answer(False, oldest_target)
 
+########################################################################################
+def load_index():
+    "Returns the DirIndex, reading it from IndexFilename the first time. A bad file is ignored."
+
+    global DirIndex
+    import cPickle as pickle
+
+    if DirIndex is None:
+        DirIndex = {}
+        if IndexFilename:
+            try:
+                with open(IndexFilename, 'rb') as ifile:
+                    index = pickle.load(ifile)
+                if type(index) == dict:
+                    DirIndex = index
+            except Exception:
+                # missing or corrupt: start over with a full scan
+                pass
+    return DirIndex
+
+########################################################################################
+def save_index():
+    "Write the DirIndex to IndexFilename, if it has changed."
+
+    global IndexChanged
+    import cPickle as pickle
+    import os
+
+    if not IndexChanged or not IndexFilename:
+        return
+
+    tmp_name = "%s.%d" % (IndexFilename, os.getpid())
+    try:
+        if not os.path.exists(os.path.dirname(IndexFilename)):
+            os.makedirs(os.path.dirname(IndexFilename))
+        with open(tmp_name, 'wb') as ifile:
+            pickle.dump(DirIndex, ifile, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_name, IndexFilename)
+    except (IOError, OSError, pickle.PicklingError):
+        pass
+    IndexChanged = False
+
+########################################################################################
+def list_dir(dirname):
+    """
+    Returns the files and the sub-directories of a directory, from the DirIndex if the
+    directory has not changed since it was indexed. Links to directories are in neither list.
+
+    dirname : (str) An absolute directory name
+    =>      : (list of str, list of str) The names of its files, and of its sub-directories
+    """
+
+    global IndexChanged
+    import os
+    import stat
+    import time
+
+    index = load_index()
+    try:
+        dir_mtime = os.stat(dirname).st_mtime
+    except OSError:
+        return ([], [])
+
+    try:
+        mtime, files, subdirs = index[dirname]
+        if mtime == dir_mtime:
+            return (files, subdirs)
+    except (KeyError, ValueError, TypeError):
+        pass
+
+    files, subdirs = [], []
+    if scandir is not None:
+        # the type of each entry usually comes with the listing, without a stat
+        try:
+            entries = list(scandir(dirname))
+        except OSError:
+            entries = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif not (entry.is_symlink() and entry.is_dir()):
+                    files.append(entry.name)
+            except OSError:
+                continue
+    else:
+        try:
+            names = os.listdir(dirname)
+        except OSError:
+            names = []
+        for name in names:
+            try:
+                mode = os.lstat(os.path.join(dirname, name)).st_mode
+            except OSError:
+                continue
+            if stat.S_ISDIR(mode):
+                subdirs.append(name)
+            elif not (stat.S_ISLNK(mode) and os.path.isdir(os.path.join(dirname, name))):
+                files.append(name)
+
+    if time.time() - dir_mtime > INDEX_MIN_AGE:
+        index[dirname] = [dir_mtime, files, subdirs]
+        IndexChanged = True
+    return (files, subdirs)
+
+########################################################################################
+def walk_dir(top):
+    """
+    Yields (dirname, files) for top and every directory beneath it, excluding '.' directories.
+    """
+
+    import os.path
+
+    to_visit = [top]
+    while to_visit:
+        dirname = to_visit.pop()
+        files, subdirs = list_dir(dirname)
+        yield (dirname, files)
+        to_visit.extend([os.path.join(dirname, it) for it in subdirs if not it.startswith('.')])
+
 ########################################################################################
 def glob_files(dirs, patterns, recursive=False):
     """
@@ -133,6 +332,93 @@ def glob_files(dirs, patterns, recursive=False):
 
     If recursive is True, each directory will be searched top-down 
     (but will exclude '.' directories)
+
+    Directory listings are taken from the DirIndex where possible.
+    """
+
+    from fnmatch import fnmatch
+    import os.path
+
+    #--------------------------------------------
+    def matches(fname):
+        # as with glob, '.' files only match patterns that start with '.'
+        if fname.startswith('.'):
+            return any(fnmatch(fname, it) for it in patterns if it.startswith('.'))
+        return any(fnmatch(fname, it) for it in patterns)
+
+    result = []
+    for dir in dirs:
+        dirname = os.path.abspath(dir)
+        if recursive:
+            all_dirs = walk_dir(dirname)
+        else:
+            all_dirs = [(dirname, list_dir(dirname)[0])]
+
+        for (dname, files) in all_dirs:
+            result.extend([os.path.join(dname, fname) for fname in files if matches(fname)])
+
+    save_index()
+
+    # ensure uniqueness
+    return list(set(result))
+
+########################################################################################
+def find_files(dirs, suffixes, recursive=True, prune=(), visited=None):
+    """
+    Returns the files in all of the directories that end with any of the suffixes, together
+    with their stat results. Each tree is walked once, and '.' files and directories, as well as
+    any directories in prune, are skipped over during the walk. The mtime of each file is
+    also stored in Mtimes, so that calc_mtimes need not stat it again.
+
+    dirs      : (list of str) The directories to search
+    suffixes  : (list of str) File suffixes, such as '.sv'
+    recursive : (bool) If True, search all sub-directories as well
+    prune     : (list of str) Directories (such as generated ones) that should not be searched
+    visited   : (list) If given, the absolute name of each directory searched is appended to it
+    =>        : (list of (str, stat_result)) The absolute filename and stat of each file
+    """
+
+    import os
+
+    suffixes = tuple(suffixes)
+    prune = set([os.path.abspath(it) for it in prune])
+
+    result = []
+    found = set()
+    for dir in dirs:
+        to_visit = [os.path.abspath(dir)]
+        while to_visit:
+            dirname = to_visit.pop()
+            if dirname in prune:
+                continue
+            if visited is not None:
+                visited.append(dirname)
+            files, subdirs = list_dir(dirname)
+            for fname in files:
+                if fname.endswith(suffixes) and not fname.startswith('.'):
+                    fname = os.path.join(dirname, fname)
+                    if fname in found:
+                        continue
+                    try:
+                        stat = os.stat(fname)
+                    except OSError:
+                        # a broken link, or a file that was removed just now
+                        continue
+                    found.add(fname)
+                    Mtimes[fname] = stat.st_mtime
+                    result.append((fname, stat))
+            if recursive:
+                to_visit.extend([os.path.join(dirname, it) for it in subdirs if not it.startswith('.')])
+
+    save_index()
+    return result
+
+########################################################################################
+def baseline_glob_files(dirs, patterns, recursive=False):
+    """
+    glob_files as it was before find_files and the DirIndex (one glob per pattern per directory,
+    then abspath of every match), kept unchanged so that benchmark measures against it. Note that,
+    as then, a recursive search only globs directories that have subdirectories.
     """
 
     from glob import glob
@@ -159,10 +445,80 @@ def glob_files(dirs, patterns, recursive=False):
     result = [os.path.abspath(it) for it in result]
     return result
 
+########################################################################################
+def benchmark(num_files=50000):
+    """
+    Compares the original glob_files (baseline_glob_files), and glob_files and find_files as they
+    are now, each followed by calc_mtimes, on a synthetic tree of num_files files, with and without
+    a warm DirIndex.
+    """
+
+    import os
+    import shutil
+    import tempfile
+    import time
+
+    global DirIndex, Mtimes
+
+    suffixes = ['.sv', '.v', '.svh']
+    files_per_dir = 50
+    top = tempfile.mkdtemp(prefix='pymake_bench.')
+    try:
+        # 3 levels of directories, with a mix of matching and non-matching files
+        print("Creating %d files in %s" % (num_files, top))
+        for idx in range(0, num_files, files_per_dir):
+            dirname = os.path.join(top, 'd%d' % (idx % 7), 'd%d' % (idx % 53), 'd%d' % idx)
+            # (an empty subdirectory, so that baseline_glob_files globs this one)
+            os.makedirs(os.path.join(dirname, 'obj'))
+            for fidx in range(files_per_dir):
+                ext = ('.sv', '.svh', '.v', '.txt', '.o')[fidx % 5]
+                open(os.path.join(dirname, 'f%d%s' % (fidx, ext)), 'w').close()
+        # generated directories are pruned by find_files, but only filtered after glob_files
+        os.makedirs(os.path.join(top, 'gen_pkg'))
+        for fidx in range(num_files // 10):
+            open(os.path.join(top, 'gen_pkg', 'g%d.sv' % fidx), 'w').close()
+        time.sleep(INDEX_MIN_AGE + 1)
+
+        #--------------------------------------------
+        def baseline_run():
+            srcs = baseline_glob_files([top], ['*%s' % it for it in suffixes], recursive=True)
+            srcs = [it for it in srcs if not it.startswith(os.path.join(top, 'gen_pkg'))]
+            calc_mtimes(srcs)
+            return len(srcs)
+
+        #--------------------------------------------
+        def glob_run():
+            srcs = glob_files([top], ['*%s' % it for it in suffixes], recursive=True)
+            srcs = [it for it in srcs if not it.startswith(os.path.join(top, 'gen_pkg'))]
+            calc_mtimes(srcs)
+            return len(srcs)
+
+        #--------------------------------------------
+        def find_run():
+            srcs = find_files([top], suffixes, prune=[os.path.join(top, 'gen_pkg')])
+            calc_mtimes([it[0] for it in srcs])
+            return len(srcs)
+
+        for (name, func) in (('baseline', baseline_run), ('glob_files', glob_run), ('find_files', find_run)):
+            for index in ('cold', 'warm'):
+                if index == 'cold':
+                    DirIndex = None
+                Mtimes = {}
+                start = time.time()
+                count = func()
+                print("%-10s %s index: %6d files in %.3fs" % (name, index, count, time.time() - start))
+    finally:
+        shutil.rmtree(top)
+
 ########################################################################################
 if __name__ == '__main__':
-    # treat argv[0] as target and rest as sources
     import sys
+
+    if sys.argv[1:2] == ['--bench']:
+        benchmark(*[int(it) for it in sys.argv[2:3]])
+        sys.exit(0)
+
+    # treat argv[0] as target and rest as sources
     print("Checking %s against %s" % (sys.argv[1], sys.argv[2:]))
 
     try:
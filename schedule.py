@@ -1,5 +1,6 @@
+import executor
 import gvars
-import sge_tools as sge
+import telemetry
 
 MAIN_PHASES = ('clean', 'build', 'genip', 'vlog', 'simulate', 'final_cleanup')
 
@@ -39,34 +40,230 @@ def set_schedule(phases_to_run):
         Schedule[gadget.schedule_phase].append(gadget)
         gvars.Log.debug("Added gadget %s to %s" % (gadget.name, gadget.schedule_phase))
 
-    # clear out any added if the gadgets won't be run:
+    # clear out any added if the gadgets won't be run, except for those phases named on their own
+    # (such as pre_clean, for gadgets that only report on something)
     for my_phase in MAIN_PHASES:
         if my_phase not in phases_to_run:
-            clear_phase(['pre_%s' % my_phase, my_phase, 'post_%s' % my_phase])
+            clear_phase([it for it in ['pre_%s' % my_phase, my_phase, 'post_%s' % my_phase] if it not in phases_to_run])
 
 ########################################################################################
 def run_schedule():
-    for phase in PHASES:
-        gvars.Log.debug("Entering phase.%s" % phase)
-        if len(Schedule[phase]):
-            # check each job's dependencies
-            jobs = [it for it in Schedule[phase] if it.check_dependencies() == True]
-            # set all of the command-lines for each of the jobs
-            for job in jobs:
-                # check each job's dependencies
-                job.prepare()
-
-            # if each job didn't fill out its command, or its doNotLaunch is set, 
-            # then boot it (it will not run)
-            jobs = [it for it in jobs if it.cmd and not it.doNotLaunch]
-            if jobs:
-                gvars.Log.debug("Running phase.%s (%d jobs to run)." % (phase, len(jobs)))
-                # if there are no interactive jobs, then run with managePool. It will run
-                # them all simultaneously.
-                if len([it for it in jobs if it.interactive]) == 0:
-                    sge.managePool(jobs)
-                else:
-                    sge.waitForSomeJobs(jobs, pollingMode=False)
+    """
+    Launch each gadget as soon as all of the gadgets that it follows have completed. The phases
+    only determine the default ordering of gadgets that do not declare their own predecessors.
+    """
+
+    gadgets = [it for phase in PHASES for it in Schedule[phase]]
+    link_gadgets(gadgets)
+
+    pending = gadgets
+    while pending:
+        pending = run_free_gadgets(pending)
+        if not pending:
+            break
+
+        # batch jobs are all handed to one pool, which holds back each one (see
+        # Gadget.pauseJob) until its own prior gadgets complete
+        jobs = get_pool(pending)
+        if jobs:
+            jobs = coalesce_jobs(jobs)
+            gvars.Log.debug("Running pool of %d jobs." % len(jobs))
+            executor.manage_pool(jobs)
+        else:
+            # only interactive jobs are free to go
+            jobs = [it for it in pending if it.is_free()]
+            if not jobs:
+                gvars.Log.critical("Unable to schedule any of: %s" % [it.name for it in pending])
+            gvars.Log.debug("Running %d interactive jobs." % len(jobs))
+            executor.wait_for_jobs(jobs)
+
+        for job in jobs:
+            job.completed = True
+        pending = [it for it in pending if not it.completed]
+
+########################################################################################
+def run_free_gadgets(pending):
+    """
+    Get each free gadget ready. Those that have nothing to launch are completed right away,
+    which may in turn free up others. Returns the gadgets that have not yet completed.
+    """
+
+    progress = True
+    while progress:
+        progress = False
+        free = [it for it in pending if it.is_free()]
+        ready_in_threads([it for it in free if it.lightweight])
+        for gadget in free:
+            if not gadget.get_ready():
+                gadget.mark_completed()
+                progress = True
+        pending = [it for it in pending if not it.completed]
+    return pending
+
+########################################################################################
+def ready_in_threads(gadgets):
+    """
+    Get the lightweight gadgets ready in up to PROJ.PREPARE_THREADS threads at once, rather
+    than one after another. Any exception raised by one of them is raised here.
+    """
+
+    todo = [it for it in gadgets if it.readied is None]
+    if len(todo) < 2:
+        return
+    num_threads = min(gvars.PROJ.PREPARE_THREADS, len(todo))
+    if num_threads < 2:
+        return
+
+    import sys
+    import threading
+
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        while True:
+            with lock:
+                if not todo or errors:
+                    return
+                gadget = todo.pop(0)
+            try:
+                gadget.get_ready()
+            except BaseException:
+                # such as the SystemExit of a Log.critical
+                with lock:
+                    errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=worker, name='ready_%d' % it) for it in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        executor.reraise(errors[0])
+
+########################################################################################
+def coalesce_jobs(jobs):
+    """
+    Returns the jobs, with those that may be coalesced (see Gadget.coalesce) and that are ready
+    to launch now replaced by a BatchGadget for each phase, queue and directory. Those readied
+    later, within the pool, are launched on their own.
+    """
+
+    import fnmatch
+    from gadgets.batch import BatchGadget
+
+    def may_coalesce(job):
+        if job.coalesce is not None:
+            return job.coalesce
+        return any(fnmatch.fnmatchcase(job.name, it) for it in gvars.PROJ.COALESCE_GADGETS)
+
+    groups = {}
+    for job in jobs:
+        if (job.readied and job.is_free() and not job.runLocally and may_coalesce(job)
+                and executor.get_executor(job) == 'sge'):
+            key = (job.schedule_phase, job.queue, tuple(job.resources), job.cwd)
+            groups.setdefault(key, []).append(job)
+
+    result = list(jobs)
+    for key in sorted(groups, key=lambda it: PHASES.index(it[0])):
+        members = groups[key]
+        if len(members) < 2:
+            continue
+        batch = BatchGadget(members, len([it for it in result if isinstance(it, BatchGadget)]))
+        batch.get_ready()
+        gvars.Log.debug("%s runs %s" % (batch.name, [it.name for it in members]))
+        result = [it for it in result if it not in members] + [batch]
+    return result
+
+########################################################################################
+def get_pool(pending):
+    """
+    Returns the batch (non-interactive) gadgets that can all be run in one managePool, which
+    are those that do not follow any pending interactive gadgets. Returns an empty list if
+    none of them is free to launch yet.
+    """
+
+    pool = [it for it in pending if not it.interactive]
+    while True:
+        members = set(id(it) for it in pool)
+        keep = [it for it in pool if all(p.completed or id(p) in members for p in it.prior_gadgets)]
+        if len(keep) == len(pool):
+            break
+        pool = keep
+
+    if not any(it.is_free() for it in pool):
+        return []
+    return pool
+
+########################################################################################
+def link_gadgets(gadgets):
+    """
+    Fill in each gadget's prior_gadgets from its predecessors, its inputs, and the phase order.
+    Only gadgets that are scheduled to run are considered.
+    """
+
+    import os.path
+
+    producers = {}
+    for gadget in gadgets:
+        for fname in gadget.outputs:
+            producers.setdefault(os.path.abspath(fname), []).append(gadget)
+
+    scheduled = set(id(it) for it in gadgets)
+    for gadget in gadgets:
+        predecessors = gadget.get_predecessors()
+        if predecessors is None:
+            phase_idx = PHASES.index(gadget.schedule_phase)
+            predecessors = [PHASES[phase_idx-1]] if phase_idx else []
+
+        prior = []
+        for pred in predecessors:
+            if isinstance(pred, str):
+                if pred not in PHASES:
+                    gvars.Log.critical("The gadget %s follows an unknown phase '%s'" % (gadget.name, pred))
+                last_idx = PHASES.index(pred)
+                prior.extend([it for it in gadgets if PHASES.index(it.schedule_phase) <= last_idx])
+            else:
+                prior.append(pred)
+
+        for fname in gadget.inputs:
+            prior.extend(producers.get(os.path.abspath(fname), []))
+
+        # unique, scheduled, and never itself
+        seen = set([id(gadget)])
+        gadget.prior_gadgets = []
+        for it in prior:
+            if id(it) in scheduled and id(it) not in seen:
+                seen.add(id(it))
+                gadget.prior_gadgets.append(it)
+        gvars.Log.debug("Gadget %s follows %s" % (gadget.name, [it.name for it in gadget.prior_gadgets]))
+        telemetry.record('schedule', gadget, phase=gadget.schedule_phase,
+                         prior=[it.name for it in gadget.prior_gadgets])
+
+    check_for_cycles(gadgets)
+
+########################################################################################
+def check_for_cycles(gadgets):
+    "Critical error if any gadget eventually follows itself."
+
+    DONE, VISITING = range(2)
+    state = {}
+
+    def visit(gadget, path):
+        state[id(gadget)] = VISITING
+        path.append(gadget)
+        for prior in gadget.prior_gadgets:
+            if state.get(id(prior)) == VISITING:
+                cycle = path[[id(it) for it in path].index(id(prior)):] + [prior]
+                gvars.Log.critical("Gadgets have a circular dependency: %s" % ' -> '.join([it.name for it in cycle]))
+            elif id(prior) not in state:
+                visit(prior, path)
+        path.pop()
+        state[id(gadget)] = DONE
+
+    for gadget in gadgets:
+        if id(gadget) not in state:
+            visit(gadget, [])
 
 ########################################################################################
 def clear_phase(phase):
@@ -0,0 +1,260 @@
+#!/usr/bin/env python2.7
+
+"""
+Summarizes simulation logfiles.
+
+Each logfile is read a line at a time for its UVM_ERROR and UVM_FATAL counts (VCS runtime
+Error-[...] messages count as errors), the signature of its first failure, its test, seed, and
+final simulation time. Results are kept in .gogo/simlogs.json, keyed on logfile, and a logfile is
+only read again once its mtime or size changes. Those that must be read are read in parallel.
+
+Failures are grouped into buckets by signature: the id and message of the first failure, with
+numbers replaced by '#', so that runs which failed the same way land in the same bucket.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import re
+
+# a UVM report, such as "UVM_ERROR file.sv(12) @ 100ns: uvm_test_top.env [ID] message"
+REPORT_RE = re.compile(r'^(UVM_ERROR|UVM_FATAL)\s+(?:\S+\(\d+\)\s+)?@\s*([^:]*):\s*(\S+)\s+\[([^\]]*)\]\s*(.*)')
+
+# a VCS runtime error, such as "Error-[NOA] Null object access"
+VCS_ERROR_RE = re.compile(r'^Error-\[([^\]]*)\]\s*(.*)')
+
+# the simv command-line and trailer
+SEED_RE = re.compile(r'\+seed=(\d+)')
+TEST_RE = re.compile(r'\+UVM_TESTNAME=(\w+)')
+TIME_RE = re.compile(r'^\s*(?:Time:|\$finish at simulation time)\s*(\d+\s*\w*)')
+FINISHED = ('V C S   S i m u l a t i o n   R e p o r t', '$finish')
+
+# numbers (and hex numbers) are removed from signatures
+NUMBER_RE = re.compile(r'0x[0-9a-fA-F]+|\d+')
+
+# Logfiles with fewer than this many to read are read serially
+PARALLEL_MIN = 4
+
+########################################################################################
+def get_db_filename():
+    import gvars
+    return os.path.join(gvars.GogoDir, 'simlogs.json')
+
+########################################################################################
+def parse_log(logfile):
+    """
+    Returns the summary of one logfile as a dict with:
+    errors, fatals : (int) The number of each
+    signature      : (str) The signature of the first failure, or None
+    message        : (str) The first failure, as it was printed
+    test, seed     : (str, int) As found on the simv command-line, or None
+    time           : (str) The last simulation time seen, such as '1200 ns'
+    status         : (str) 'passed', 'failed', or 'incomplete' if the simulation never finished
+    """
+
+    result = {'errors': 0, 'fatals': 0, 'signature': None, 'message': None,
+              'test': None, 'seed': None, 'time': None}
+    finished = False
+
+    with open(logfile) as lfile:
+        for line in lfile:
+            if line.startswith(('UVM_ERROR', 'UVM_FATAL')):
+                match = REPORT_RE.match(line)
+                if not match:
+                    # such as the counts of the UVM Report Summary
+                    continue
+                kind, sim_time, _, msg_id, message = match.groups()
+                result['errors' if kind == 'UVM_ERROR' else 'fatals'] += 1
+                result['time'] = sim_time.strip()
+                if result['signature'] is None:
+                    result['signature'] = "%s [%s] %s" % (kind, msg_id, NUMBER_RE.sub('#', message.strip()))
+                    result['message'] = line.strip()
+            elif line.startswith('Error-['):
+                match = VCS_ERROR_RE.match(line)
+                result['errors'] += 1
+                if result['signature'] is None and match:
+                    result['signature'] = "Error-[%s] %s" % (match.group(1), NUMBER_RE.sub('#', match.group(2).strip()))
+                    result['message'] = line.strip()
+            elif '+seed=' in line or '+UVM_TESTNAME=' in line:
+                match = SEED_RE.search(line)
+                if match and result['seed'] is None:
+                    result['seed'] = int(match.group(1))
+                match = TEST_RE.search(line)
+                if match and result['test'] is None:
+                    result['test'] = match.group(1)
+            elif 'Time:' in line or '$finish' in line or FINISHED[0] in line:
+                match = TIME_RE.match(line)
+                if match:
+                    result['time'] = match.group(1).strip()
+                if any(it in line for it in FINISHED):
+                    finished = True
+
+    if result['errors'] or result['fatals']:
+        result['status'] = 'failed'
+    elif finished:
+        result['status'] = 'passed'
+    else:
+        result['status'] = 'incomplete'
+    return result
+
+########################################################################################
+def parse_entry(args):
+    "Parse one (logfile, mtime, size) for scan. Returns (logfile, summary)."
+
+    logfile, mtime, size = args
+    try:
+        result = parse_log(logfile)
+    except IOError as exc:
+        result = {'status': 'unreadable', 'errors': 0, 'fatals': 0, 'signature': str(exc)}
+    result['mtime'] = mtime
+    result['size'] = size
+    return logfile, result
+
+########################################################################################
+def load_db(db_filename):
+    try:
+        with open(db_filename) as dfile:
+            return json.load(dfile)
+    except (IOError, ValueError):
+        return {}
+
+########################################################################################
+def save_db(db_filename, db):
+    tmp_name = "%s.%d" % (db_filename, os.getpid())
+    try:
+        if not os.path.exists(os.path.dirname(db_filename)):
+            os.makedirs(os.path.dirname(db_filename))
+        with open(tmp_name, 'w') as dfile:
+            json.dump(db, dfile)
+        os.rename(tmp_name, db_filename)
+    except (IOError, OSError):
+        pass
+
+########################################################################################
+def scan(logfiles, db_filename=None, processes=None):
+    """
+    Returns the summary of each logfile (see parse_log) as a dict keyed on logfile. Only those
+    that have changed since they were recorded in db_filename are read.
+
+    logfiles    : (list of str) The logfiles
+    db_filename : (str) Where the summaries are kept, or None for .gogo/simlogs.json
+    processes   : (int) The most logfiles to read at once, or None for the number of cores
+    """
+
+    if db_filename is None:
+        db_filename = get_db_filename()
+    db = load_db(db_filename)
+
+    todo = []
+    for logfile in logfiles:
+        try:
+            stat = os.stat(logfile)
+        except OSError:
+            continue
+        entry = db.get(logfile)
+        if entry is None or entry.get('mtime') != stat.st_mtime or entry.get('size') != stat.st_size:
+            todo.append((logfile, stat.st_mtime, stat.st_size))
+
+    if len(todo) < PARALLEL_MIN or processes == 1:
+        parsed = [parse_entry(it) for it in todo]
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(processes or multiprocessing.cpu_count(), len(todo)))
+        try:
+            parsed = pool.map(parse_entry, todo, chunksize=1)
+        finally:
+            pool.terminate()
+
+    db.update(parsed)
+    if todo:
+        save_db(db_filename, db)
+
+    return dict((it, db[it]) for it in logfiles if it in db)
+
+########################################################################################
+def get_buckets(results):
+    """
+    Returns the runs that did not pass, grouped by signature, as a list of (signature, [logfiles]),
+    most common first.
+    """
+
+    buckets = {}
+    for logfile, result in results.items():
+        if result['status'] != 'passed':
+            signature = result.get('signature') or result['status']
+            buckets.setdefault(signature, []).append(logfile)
+
+    return sorted(buckets.items(), key=lambda it: (-len(it[1]), it[0]))
+
+########################################################################################
+def print_summary(results):
+    "Print each run's results and the buckets of failures."
+
+    for logfile in sorted(results):
+        result = results[logfile]
+        print("%-40s %-10s errors=%-4d fatals=%-4d seed=%-10s time=%s" % (
+            os.path.dirname(logfile) or logfile, result['status'], result['errors'], result['fatals'],
+            result.get('seed'), result.get('time')))
+
+    passed = len([it for it in results.values() if it['status'] == 'passed'])
+    print('')
+    print("%d passed, %d did not." % (passed, len(results) - passed))
+
+    for signature, logfiles in get_buckets(results):
+        print('')
+        print("%4d : %s" % (len(logfiles), signature))
+        for logfile in sorted(logfiles)[:5]:
+            print("       %s" % logfile)
+        if len(logfiles) > 5:
+            print("       ...and %d more" % (len(logfiles) - 5))
+
+########################################################################################
+def benchmark(num_logs=200, num_lines=20000):
+    "Time a cold and a warm scan of logfiles in a temporary directory."
+
+    import shutil
+    import tempfile
+    import time
+
+    top = tempfile.mkdtemp(prefix='simlogs_bench')
+    try:
+        logfiles = []
+        for idx in range(num_logs):
+            logfile = os.path.join(top, 'test%d.%d' % (idx % 10, idx), 'logfile')
+            os.makedirs(os.path.dirname(logfile))
+            with open(logfile, 'w') as lfile:
+                print("Command: simv +UVM_TESTNAME=test%d_test_c +seed=%d" % (idx % 10, idx), file=lfile)
+                for num in range(num_lines):
+                    print("UVM_INFO env.sv(%d) @ %dns: uvm_test_top.env [STEP] step %d" % (num, num, num), file=lfile)
+                if idx % 7 == 0:
+                    print("UVM_ERROR sb.sv(12) @ %dns: uvm_test_top.env.sb [MISMATCH] exp 0x%x got 0x%x" % (num_lines, idx, idx + 1), file=lfile)
+                print("           V C S   S i m u l a t i o n   R e p o r t", file=lfile)
+                print("Time: %d ns" % num_lines, file=lfile)
+            logfiles.append(logfile)
+
+        db_filename = os.path.join(top, 'simlogs.json')
+        for label, processes in (('serial', 1), ('parallel', None)):
+            if os.path.exists(db_filename):
+                os.remove(db_filename)
+            start = time.time()
+            results = scan(logfiles, db_filename, processes)
+            print("%-8s cold scan of %d logs: %.2fs" % (label, num_logs, time.time() - start))
+
+        start = time.time()
+        scan(logfiles, db_filename)
+        print("warm scan of %d logs: %.3fs" % (num_logs, time.time() - start))
+        print("%d buckets" % len(get_buckets(results)))
+    finally:
+        shutil.rmtree(top)
+
+########################################################################################
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench':
+        benchmark(*[int(it) for it in sys.argv[2:]])
+    else:
+        import glob
+        logfiles = sys.argv[1:] or glob.glob('sim/*/logfile')
+        print_summary(scan(logfiles, os.path.join('.gogo', 'simlogs.json')))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python2.7
+
+"""
+Measures where the time goes before gogo starts running gadgets (see --profile-startup).
+
+Each step of gogo's start (see step) is always timed. While profiling, the first import of each
+module is timed too, both in total and excluding the modules that it imports in turn. The
+breakdown is printed just before the schedule is run, or when gogo exits if it never gets there.
+
+Run this file with --bench to time gogo's cold start, and to fail if it is over budget.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+# When this module was first imported, which is the first thing that gogo does
+Start = time.time()
+
+# Set by profile_imports
+Profiling = False
+
+# Each first import, in order, as [name, depth, total seconds, seconds within nested imports]
+Imports = []
+
+# The imports in progress, innermost last
+Stack = []
+
+# Each step, in order, as (name, seconds)
+Steps = []
+
+# Set once the profile has been printed
+Printed = False
+
+# Imports that took less than this many seconds are left out of the profile
+MIN_TIME = 0.001
+
+########################################################################################
+def profile_imports():
+    "Time the first import of each module from now on, and print the profile at exit."
+
+    global Profiling
+
+    try:
+        import __builtin__ as builtins
+    except ImportError:
+        import builtins
+    import atexit
+
+    original = builtins.__import__
+
+    def timed_import(name, *args, **kwargs):
+        if name in sys.modules:
+            return original(name, *args, **kwargs)
+
+        entry = [name, len(Stack), 0.0, 0.0]
+        Imports.append(entry)
+        Stack.append(entry)
+        start = time.time()
+        try:
+            return original(name, *args, **kwargs)
+        finally:
+            entry[2] = time.time() - start
+            Stack.pop()
+            if Stack:
+                Stack[-1][3] += entry[2]
+
+    builtins.__import__ = timed_import
+    Profiling = True
+    atexit.register(print_profile)
+
+########################################################################################
+class step(object):
+    "Times a step of gogo's start, as a with-statement."
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        Steps.append((self.name, time.time() - self.start))
+        return False
+
+########################################################################################
+def print_profile():
+    "Print the time taken by each import and step so far, if profiling, and only once."
+
+    global Printed
+
+    if not Profiling or Printed:
+        return
+    Printed = True
+
+    out = sys.stderr
+    print("", file=out)
+    print("Startup profile (ms)            total     self", file=out)
+    for name, depth, total, nested in Imports:
+        if depth == 0 or total >= MIN_TIME:
+            label = '  ' * depth + 'import ' + name
+            print("  %-28s %8.1f %8.1f" % (label, total * 1000, (total - nested) * 1000), file=out)
+    for name, seconds in Steps:
+        print("  %-28s %8.1f" % (name, seconds * 1000), file=out)
+    print("  %-28s %8.1f" % ('since start', (time.time() - Start) * 1000), file=out)
+    print("", file=out)
+
+########################################################################################
+def benchmark(budget=1.0, repeats=5):
+    """
+    Time gogo's cold start, the best of repeats runs each of 'gogo --version' and 'gogo help_vars'.
+    Returns False if any took longer than budget seconds.
+    """
+
+    import os
+    import subprocess
+
+    gogo = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gogo')
+    ok = True
+    with open(os.devnull, 'w') as devnull:
+        for args in (['--version'], ['help_vars']):
+            times = []
+            for _ in range(repeats):
+                start = time.time()
+                status = subprocess.call([sys.executable, gogo] + args, stdout=devnull, stderr=devnull)
+                times.append(time.time() - start)
+                if status:
+                    # a gogo that fails to start would otherwise look fast
+                    print("gogo %s exited with status %d" % (' '.join(args), status))
+                    ok = False
+            best = min(times)
+            over = best > budget
+            ok = ok and not over
+            print("gogo %-10s best of %d: %.3fs%s" % (' '.join(args), repeats, best,
+                                                    "  OVER BUDGET of %.3fs" % budget if over else ''))
+    return ok
+
+########################################################################################
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench':
+        args = sys.argv[2:]
+        budget = float(args[0]) if args else 1.0
+        repeats = int(args[1]) if len(args) > 1 else 5
+        sys.exit(0 if benchmark(budget, repeats) else 1)
+    print(__doc__)
@@ -0,0 +1,94 @@
+"""
+Records the lifecycle of each gadget to a JSON-lines file in the .gogo directory.
+
+Every line is one event, with the run id, the time, the event name, the gadget name (for gadget
+events), and fields particular to that event:
+
+run_start          : gadgets (the gadgets to run), cwd
+schedule           : phase, prior (the names of the gadgets it follows)
+check_dependencies : result, duration
+create_cmds        : commands (how many), duration
+script             : duration (to write the script)
+done               : (the gadget completed with nothing to launch)
+submit             : (the job was handed to SGE, or run locally)
+finish             : status, start (when the script began running), rss (peak KB, if known)
+run_end            : status
+
+See gadgets/report.py, which summarizes them.
+"""
+
+import json
+import os
+import time
+
+# The file that events are appended to. Nothing is recorded until start_run sets this.
+LogFilename = None
+
+# Identifies all of the events of this invocation of gogo
+RunId = None
+
+# When the file grows beyond this, it is moved aside and a new one started
+MAX_SIZE = 10 * 1024 * 1024
+
+########################################################################################
+def start_run(filename, gadgets_to_run):
+    "Start recording events of this run to filename."
+
+    global LogFilename, RunId
+
+    LogFilename = filename
+    RunId = "%d.%d" % (int(time.time()), os.getpid())
+
+    try:
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        if os.path.getsize(filename) > MAX_SIZE:
+            os.rename(filename, filename + '.1')
+    except OSError:
+        pass
+
+    record('run_start', gadgets=gadgets_to_run, cwd=os.getcwd())
+
+########################################################################################
+def record(event, gadget=None, **fields):
+    "Append an event, with any other fields given, to the LogFilename."
+
+    if not LogFilename:
+        return
+
+    entry = {'run': RunId, 'time': time.time(), 'event': event}
+    if gadget is not None:
+        entry['gadget'] = gadget.name
+    entry.update(fields)
+
+    try:
+        with open(LogFilename, 'a') as lfile:
+            lfile.write(json.dumps(entry) + '\n')
+    except IOError:
+        pass
+
+########################################################################################
+def read_runs(filename):
+    """
+    Returns the events of every run recorded in filename, as a list of (run id, events), oldest
+    first. Lines that cannot be parsed (as from a run that was killed while writing) are skipped.
+    """
+
+    runs = {}
+    order = []
+    try:
+        with open(filename) as lfile:
+            for line in lfile:
+                try:
+                    entry = json.loads(line)
+                    run = entry['run']
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if run not in runs:
+                    runs[run] = []
+                    order.append(run)
+                runs[run].append(entry)
+    except IOError:
+        pass
+
+    return [(it, runs[it]) for it in order]
@@ -4,6 +4,7 @@ Common utilities module.
 
 from __future__ import print_function
 
+import errno
 import gvars
 import os
 from __builtin__ import open as builtin_open
@@ -21,8 +22,7 @@ def get_all_sources(source_type='verilog'):
     """
 
     global AllVerilogSources
-    import os.path
-    from pymake import glob_files
+    import flists
 
     # only ever do this once
     if AllVerilogSources is None:
@@ -30,11 +30,8 @@ def get_all_sources(source_type='verilog'):
         for vkit in gvars.Vkits:
             AllVerilogSources.extend(vkit.get_all_sources())
 
-        for flist in gvars.TB.FLISTS:
-            fname = os.path.abspath(flist)
-            dirname = os.path.dirname(fname)
-            all_flist_sources = glob_files([dirname], ['*.v', '*.sv', '*.vh', '*.svh'])
-            AllVerilogSources.extend(all_flist_sources)
+        # everything that the testbench flists name, or `include
+        AllVerilogSources.extend(flists.get_sources(gvars.TB.FLISTS))
 
     return AllVerilogSources
 
@@ -83,6 +80,32 @@ def open(filename, mode='w'):
 
     return afile
 
+########################################################################################
+def write_if_changed(filename, text):
+    """
+    Writes text to the translated filename (see get_filename), but only if its contents differ,
+    so that its mtime changes only when its contents do. The file is written under a temporary
+    name and renamed into place, so readers never see a partial file.
+
+    filename : (str) The file, which is translated with get_filename
+    text     : (str) Its contents
+    =>       : (bool) True if the file was written
+    """
+
+    filename = get_filename(filename)
+    try:
+        with builtin_open(filename) as afile:
+            if afile.read() == text:
+                return False
+    except IOError:
+        pass
+
+    tmp_name = "%s.%d" % (filename, os.getpid())
+    with builtin_open(tmp_name, 'w') as afile:
+        afile.write(text)
+    os.rename(tmp_name, filename)
+    return True
+
 ########################################################################################
 def get_filename(filename):
     """
@@ -98,8 +121,7 @@ def get_filename(filename):
     if filename.startswith(gvars.GogoDir):
         return filename
 
-    if not os.path.exists(gvars.GogoDir):
-        os.mkdir(gvars.GogoDir)
+    make_dir(gvars.GogoDir)
 
     # calculate the directory name underneath the gvars.GogoDir in which the file will be
     filename = os.path.abspath(filename)
@@ -111,11 +133,20 @@ def get_filename(filename):
     dirname = dirname.replace('/', '_')[1:]
     dirname = os.path.join(gvars.GogoDir, dirname)
 
-    if not os.path.exists(dirname):
-        os.mkdir(dirname)
+    make_dir(dirname)
     filename = os.path.join(dirname, filename)
     return filename
 
+########################################################################################
+def make_dir(dirname):
+    "Create a directory, unless it already exists (such as when another thread has just made it)."
+
+    try:
+        os.mkdir(dirname)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
 ########################################################################################
 def order_vkits(all_vkits):
     """
@@ -127,19 +158,90 @@ def order_vkits(all_vkits):
     depends.Log = gvars.Log
 
     vkit_dict = {it.name: it.dependencies for it in all_vkits}
-    ordered = depends.order_dependencies(vkit_dict)
+    try:
+        ordered = depends.order_dependencies(vkit_dict)
+    except depends.DependencyException as exc:
+        gvars.Log.critical("Unable to order vkits: %s" % exc)
     return ordered
 
 ########################################################################################
 def sort_vkits(all_vkits):
     """
     Returns the list of vkits sorted by dependency requirements. UVM will always be
-    the first in the list.
+    the first in the list. Within each dependency level, vkits keep their given order.
     """
 
-    sorted_vkits = []
     ordered = order_vkits(all_vkits)
-    groups = range(max(ordered.values())+1)
-    for group in groups:
-        sorted_vkits.extend([name for name in ordered.keys() if ordered[name]==group])
-    return [next(it for it in all_vkits if it.name == item) for item in sorted_vkits]
+    return sorted(all_vkits, key=lambda it: ordered[it.name])
+
+########################################################################################
+def prioritize_vkits(all_vkits):
+    """
+    Returns the vkits sorted by the length of the chain of vkits that depend upon them, longest
+    first, so that the critical path is launched first. Each vkit in a chain counts for its
+    average build time, or the average of all known build times if it has never been built.
+    """
+
+    times = {it.name: it.get_build_time() for it in all_vkits}
+    known = [it for it in times.values() if it]
+    default_time = sum(known) / len(known) if known else 1.0
+
+    dependents = {it.name: [] for it in all_vkits}
+    for vkit in all_vkits:
+        for dep in vkit.dependencies:
+            if dep in dependents:
+                dependents[dep].append(vkit.name)
+
+    # dependents are always at a higher level, so work down from the top
+    ordered = order_vkits(all_vkits)
+    priority = {}
+    for name in sorted(ordered, key=lambda it: ordered[it], reverse=True):
+        downstream = max([priority[it] for it in dependents[name]] or [0])
+        priority[name] = (times[name] or default_time) + downstream
+    gvars.Log.debug("Vkit priorities: %s" % priority)
+
+    return sorted(all_vkits, key=lambda it: priority[it.name], reverse=True)
+
+########################################################################################
+def check_vkit_dependencies(all_vkits):
+    """
+    Compares the DEPENDENCIES of each vkit with the vkits whose packages its sources reference,
+    as found by depends.find_dependencies. Depending upon PROJ.VKIT_DEPS, those that are missing
+    are warned about, are a critical error, or are added to the vkit's dependencies.
+    See also: depends.find_dependencies()
+    """
+
+    import depends
+    depends.Log = gvars.Log
+
+    mode = gvars.PROJ.VKIT_DEPS
+    if mode == 'off' or not all_vkits:
+        return
+
+    # the references found in each file are cached, so only changed files are scanned again, and
+    # so is the graph found from them, so nothing is walked again while nothing has changed
+    make_dir(gvars.GogoDir)
+    cache_file = os.path.join(gvars.GogoDir, 'pkg_refs.pkl')
+    graph_file = os.path.join(gvars.GogoDir, 'vkit_deps.pkl')
+    found = depends.find_dependencies(vkits=[(it.name, it.dir_name, it.pkg_name) for it in all_vkits],
+                                      cache_file=cache_file, graph_file=graph_file)
+
+    names = set([it.name for it in all_vkits])
+    any_missing = False
+    for vkit in all_vkits:
+        declared = set([it for it in vkit.dependencies if it in names])
+        missing = [it for it in found[vkit.name] if it not in declared]
+        extra = sorted(declared - set(found[vkit.name]))
+
+        if extra:
+            gvars.Log.debug("vkit %s never references the packages of these DEPENDENCIES: %s" % (vkit.name, extra))
+        if missing:
+            if mode == 'fill':
+                gvars.Log.info("Adding %s to the DEPENDENCIES of vkit %s" % (missing, vkit.name))
+                vkit.dependencies = list(vkit.dependencies) + missing
+            else:
+                gvars.Log.warning("vkit %s references the packages of these vkits, but they are not in its DEPENDENCIES: %s" % (vkit.name, missing))
+                any_missing = True
+
+    if any_missing and mode == 'error':
+        gvars.Log.critical("Vkit DEPENDENCIES are missing. Set PROJ.VKIT_DEPS='fill' to add them automatically.")
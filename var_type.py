@@ -10,6 +10,57 @@ __VALUE__, __TYPES__, __HELP__ = range(3)
 
 Log = None
 
+########################################################################################
+class Deferred(object):
+    """
+    A value that is only computed when it is first used, for variables that are expensive to find,
+    such as those that need a module to be loaded. It may be assigned to a variable, or be one of
+    the items of a list variable, and is replaced by its value when the variable is first read.
+    Adding a string to it (on either side) gives another Deferred, so that paths may be built
+    from it:
+
+        VERDI_HOME = defer_env_variable('VERDI_HOME', PROJ.MODULES['verdi'])
+        VLOG.ARC_LIBS = [VERDI_HOME + '/share/PLI/VCS/LINUX64/pli.a']
+    """
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        self.evaluated = False
+        self.value = None
+
+    def get(self):
+        if not self.evaluated:
+            self.value = self.func(*self.args)
+            self.evaluated = True
+        return self.value
+
+    def __add__(self, other):
+        return Deferred(lambda: self.get() + resolve(other))
+
+    def __radd__(self, other):
+        return Deferred(lambda: resolve(other) + self.get())
+
+    def __str__(self):
+        return str(self.get())
+
+    def __repr__(self):
+        if self.evaluated:
+            return repr(self.value)
+        return "Deferred(%s%s)" % (getattr(self.func, '__name__', 'func'), self.args)
+
+########################################################################################
+def resolve(value):
+    "Returns the value, or the list of values, with each Deferred replaced by its value."
+
+    if isinstance(value, Deferred):
+        return value.get()
+    if isinstance(value, list) and any(isinstance(it, Deferred) for it in value):
+        return [resolve(it) for it in value]
+    return value
+
+########################################################################################
+
 class VarType(object):
     def __init__(self, v_dict, v_type):
         self.myvars = v_dict.copy()
@@ -21,7 +72,8 @@ class VarType(object):
             object.__setattr__(self, name, value)
             return
         try:
-            if type(value) not in self.myvars[name][__TYPES__]:
+            # a Deferred value is checked once it has been evaluated
+            if type(value) not in self.myvars[name][__TYPES__] and not isinstance(value, Deferred):
                 raise AttributeError("%s is not permitted for %s" % (type(value), name))
             self.myvars[name][__VALUE__] = value
         except KeyError:
@@ -29,10 +81,15 @@ class VarType(object):
 
     #--------------------------------------------
     def __getattr__(self, name):
-        return self.myvars[name][__VALUE__]
+        value = self.myvars[name][__VALUE__]
+        resolved = resolve(value)
+        if resolved is not value:
+            self.__setattr__(name, resolved)
+        return resolved
 
     #--------------------------------------------
     def __repr__(self):
+         # Deferred values are shown as they are, rather than evaluated
          d = dict([(key,self.myvars[key][__VALUE__]) for key in self.myvars.keys()])
          return d.__repr__()
 